@@ -0,0 +1,187 @@
+"""Renders many maps from one job manifest, sharing the loaded datasets across a process pool.
+
+    python batch.py atlas.json [-workers N]
+
+The manifest (JSON, or YAML when PyYAML is installed) holds optional "defaults" and a list
+of "jobs". Each job names its output file and overrides any of the mapper.py settings,
+content or styling dictionaries:
+
+    {
+        "defaults": {"settings": {"nat_label_toggle": true}, "styling": {...}},
+        "jobs": [
+            {"name": "benelux", "output": "out/benelux.png",
+             "content": {"country_list": ["Belgium", "Netherlands", "Luxembourg"]}},
+            ...
+        ]
+    }
+
+The geometry (compiled store, or the NaturalEarth geojson without one), ISO table and GeoNames
+caches are loaded once in the parent process.
+Workers are forked from it where the platform allows, so they start warm and share those
+pages read-only; elsewhere each worker loads its own copy once.
+"""
+import copy
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import mapper
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+SECTIONS = {
+    "settings": mapper.map_settings,
+    "content": mapper.map_content,
+    "styling": mapper.map_styling,
+}
+
+# Datasets shared by the jobs of a worker process
+_DATA = None
+
+
+def load_manifest(manifest_path: Path):
+    """Reads a JSON or YAML job manifest"""
+    with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+        if manifest_path.suffix in [".yml", ".yaml"]:
+            if yaml is None:
+                raise ImportError("PyYAML is required for YAML manifests")
+            return yaml.safe_load(manifest_file)
+        return json.load(manifest_file)
+
+
+def build_jobs(manifest: dict, base_dir: Path):
+    """Merges the manifest defaults and each job's overrides onto copies of the mapper.py dictionaries"""
+    defaults = manifest.get("defaults", {})
+    jobs = []
+    for i, entry in enumerate(manifest["jobs"]):
+        job = {"name": entry.get("name", f"map_{i + 1}")}
+        for section, base in SECTIONS.items():
+            job[section] = copy.deepcopy(base)
+            job[section].update(defaults.get(section, {}))
+            job[section].update(entry.get(section, {}))
+        output = Path(entry.get("output", f"{job['name']}.html"))
+        job["settings"]["output_path"] = str(
+            output if output.is_absolute() else base_dir / output
+        )
+        jobs.append(job)
+    return jobs
+
+
+def prefetch_places(data: mapper.MapData, jobs: list):
+    """Downloads and ingests the GeoNames dumps of every job up front (from each job's mirror), so workers never race on the cache"""
+    iso_list = data.iso_list()
+    countries = {}  # mirror: country names
+    for job in jobs:
+        if (
+            job["settings"]["city_toggle"] == True
+            and job["settings"]["nat_toggle"] == True
+        ):
+            countries.setdefault(job["settings"]["geonames_mirror"], set()).update(
+                job["content"]["country_list"]
+            )
+
+    for mirror, names in countries.items():
+        iso_codes = iso_list.loc[iso_list["Name"].isin(names), "Code"].tolist()
+        if len(iso_codes) == 0:
+            continue
+        data.fetch_places(iso_codes, mirror)
+        for x in iso_codes:
+            data.places(x)
+
+
+def _init_worker(root: str):
+    """Loads the datasets in a worker process unless it inherited them from the parent"""
+    global _DATA
+    if _DATA is None:
+        _DATA = mapper.MapData(Path(root))
+    warnings.filterwarnings("ignore")
+
+
+def render_job(token: str, job: dict):
+    """Renders one job to its output file; returns (name, output, seconds, error)"""
+    t = time.perf_counter()
+    try:
+        m = mapper.MapBuilder(
+            token, job["settings"], job["content"], job["styling"], data=_DATA
+        )
+        m.draw_map()
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return (
+        job["name"],
+        job["settings"]["output_path"],
+        time.perf_counter() - t,
+        error,
+    )
+
+
+def run_batch(token: str, jobs: list, workers: int = None, root: Path = None):
+    """Renders jobs on a process pool sharing one MapData; returns the render_job results in job order"""
+    global _DATA
+    _DATA = mapper.MapData(root) if root is not None else mapper.MapData()
+    _DATA.warm()
+    prefetch_places(_DATA, jobs)
+    for job in jobs:
+        os.makedirs(Path(job["settings"]["output_path"]).parent, exist_ok=True)
+
+    # Fork shares the warm datasets copy-on-write; spawn-only platforms reload them per worker
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(str(_DATA.root),),
+    ) as pool:
+        futures = [pool.submit(render_job, token, job) for job in jobs]
+        return [x.result() for x in futures]
+
+
+if __name__ == "__main__":
+    map_token = os.getenv("MAP_TOKEN")
+
+    if not map_token:
+        print(
+            "Missing env values for MAP_TOKEN; Mapbox token required to create base map"
+        )
+        sys.exit(1)
+
+    if len(sys.argv) < 2 or sys.argv[1].startswith("-"):
+        print("Usage: python batch.py manifest.json [-workers N]")
+        sys.exit(1)
+
+    workers = None
+    if "-workers" in sys.argv:
+        workers_index = sys.argv.index("-workers")
+        workers = int(sys.argv[workers_index + 1])
+
+    warnings.filterwarnings("ignore")
+
+    manifest_path = Path(sys.argv[1])
+    jobs = build_jobs(load_manifest(manifest_path), manifest_path.parent)
+
+    t = time.perf_counter()
+    results = run_batch(map_token, jobs, workers=workers)
+
+    failed = 0
+    for name, output, seconds, error in results:
+        if error is None:
+            print(f"{name}: {output} ({seconds:.2f}s)")
+        else:
+            failed += 1
+            print(f"{name}: FAILED\n{error}")
+    print(
+        f"{len(results) - failed}/{len(results)} maps rendered in {time.perf_counter() - t:.2f}s"
+    )
+    sys.exit(1 if failed > 0 else 0)
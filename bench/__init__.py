@@ -0,0 +1 @@
+"""Offline benchmark suite for the map pipeline (see bench/run.py)."""
@@ -0,0 +1,257 @@
+"""Synthetic, deterministic fixtures shaped like the real mapper data.
+
+make_fixtures() writes a data root laid out like the repository (maps/, city_db/, features/)
+holding NaturalEarth-style country and admin-1 geojsons, GeoNames-format dumps, a
+cities.csv ISO table and custom feature geojsons, sized by a scenario's parameters.
+"""
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from geonames import COLUMNS
+from geostore import STORE_VERSION, compile_store
+
+
+# Parameters of each benchmark scenario
+#   countries: number of countries; subnats: admin-1 grid per country (columns, rows)
+#   vertices: points along each country edge; places: GeoNames rows per country
+#   cities: cities requested on the map; feature_lines: custom feature linestrings
+SCENARIOS = {
+    "small": {
+        "countries": 3,
+        "subnats": [4, 4],
+        "vertices": 40,
+        "places": 2_000,
+        "cities": 10,
+        "feature_lines": 5,
+    },
+    "medium": {
+        "countries": 12,
+        "subnats": [6, 6],
+        "vertices": 150,
+        "places": 10_000,
+        "cities": 60,
+        "feature_lines": 40,
+    },
+    "continent": {
+        "countries": 48,
+        "subnats": [8, 8],
+        "vertices": 400,
+        "places": 10_000,
+        "cities": 300,
+        "feature_lines": 200,
+    },
+}
+
+# Country cell size in degrees and the top left corner of the grid (roughly Europe)
+CELL = (8.0, 5.0)
+ORIGIN = (-10.0, 70.0)
+
+FEATURE_CODES = ["PPLC", "PPLA", "PPLA2", "PPLA3", "PPL", "PPL", "PPL", "PPLX"]
+
+
+def _wobble(lon, lat):
+    """Deterministic distortion of straight edges; a function of position so shared edges stay identical"""
+    return (
+        lon + 0.06 * np.sin(5.3 * lat + 1.1 * lon),
+        lat + 0.04 * np.sin(4.7 * lon - 0.7 * lat),
+    )
+
+
+def _ring(x0: float, y0: float, x1: float, y1: float, n: int):
+    """Closed ring around a box with n points per edge"""
+    t = np.linspace(0, 1, n, endpoint=False)
+    lon = np.concatenate([x0 + (x1 - x0) * t, np.full(n, x1), x1 - (x1 - x0) * t, np.full(n, x0)])
+    lat = np.concatenate([np.full(n, y0), y0 + (y1 - y0) * t, np.full(n, y1), y1 - (y1 - y0) * t])
+    lon, lat = _wobble(lon, lat)
+    ring = np.round(np.column_stack([lon, lat]), 6).tolist()
+    return ring + [ring[0]]
+
+
+def _names(n: int):
+    """n country names and unique two-letter ISO codes"""
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    codes = [a + b for a in letters for b in letters][:n]
+    return [(f"Country {i + 1:03d}", codes[i]) for i in range(n)]
+
+
+def _write_geometry(root: Path, params: dict):
+    countries = _names(params["countries"])
+    columns = int(np.ceil(np.sqrt(len(countries))))
+    sx, sy = params["subnats"]
+    n = params["vertices"]
+
+    nat, subnat, cells = [], [], []
+    for i, (name, iso) in enumerate(countries):
+        x0 = ORIGIN[0] + (i % columns) * CELL[0]
+        y1 = ORIGIN[1] - (i // columns) * CELL[1]
+        x1, y0 = x0 + CELL[0], y1 - CELL[1]
+        cells.append((name, iso, x0, y0, x1, y1))
+
+        # Mainland plus a small island, with a lake (hole) in the mainland
+        lake = _ring(x0 + 3, y0 + 2, x0 + 3.5, y0 + 2.5, max(n // 20, 2))[::-1]
+        island = _ring(x1 - 0.6, y0 - 0.4, x1 - 0.2, y0 - 0.1, max(n // 20, 2))
+        nat.append(
+            {
+                "type": "Feature",
+                "properties": {"ADMIN": name, "NAME": name, "ISO_A3": iso + "X", "ISO_A2": iso},
+                "geometry": {
+                    "type": "MultiPolygon",
+                    "coordinates": [[_ring(x0, y0, x1, y1, n), lake], [island]],
+                },
+            }
+        )
+
+        dx, dy = (x1 - x0) / sx, (y1 - y0) / sy
+        for a in range(sx):
+            for b in range(sy):
+                sub_name = f"{name} Region {a * sy + b + 1:02d}"
+                subnat.append(
+                    {
+                        "type": "Feature",
+                        "properties": {
+                            "admin": name,
+                            "adm0_a3": iso + "X",
+                            "iso_a2": iso,
+                            "name": sub_name,
+                            "name_en": sub_name,
+                            "iso_3166_2": f"{iso}-{a * sy + b + 1:02d}",
+                        },
+                        "geometry": {
+                            "type": "Polygon",
+                            "coordinates": [
+                                _ring(
+                                    x0 + a * dx,
+                                    y0 + b * dy,
+                                    x0 + (a + 1) * dx,
+                                    y0 + (b + 1) * dy,
+                                    max(n // sx, 2),
+                                )
+                            ],
+                        },
+                    }
+                )
+
+    (root / "maps").mkdir(parents=True, exist_ok=True)
+    with open(root / "maps" / "naturalearth_countries.geojson", "w", encoding="utf-8") as file:
+        json.dump({"type": "FeatureCollection", "features": nat}, file)
+    with open(root / "maps" / "naturalearth.geojson", "w", encoding="utf-8") as file:
+        json.dump({"type": "FeatureCollection", "features": subnat}, file)
+
+    # Choropleth-style geojson (same shapes as the admin-1 regions)
+    (root / "features").mkdir(parents=True, exist_ok=True)
+    with open(root / "features" / "geojson_1.geojson", "w", encoding="utf-8") as file:
+        json.dump({"type": "FeatureCollection", "features": subnat}, file)
+    return cells
+
+
+def _write_places(root: Path, cells: list, params: dict, rng):
+    (root / "city_db").mkdir(parents=True, exist_ok=True)
+    with open(root / "city_db" / "cities.csv", "w", encoding="utf-8") as file:
+        file.write("Name,Code\n")
+        for name, iso, *_ in cells:
+            file.write(f"{name},{iso}\n")
+
+    n = params["places"]
+    for k, (name, iso, x0, y0, x1, y1) in enumerate(cells):
+        # Town names repeat across countries (and within, between feature codes), as real place names do
+        rows = {
+            "geonameid": np.arange(n) + k * n,
+            "name": [f"Town {x}" for x in rng.integers(0, n, n)],
+            "latitude": np.round(rng.uniform(y0, y1, n), 5),
+            "longitude": np.round(rng.uniform(x0, x1, n), 5),
+            "feature class": np.where(rng.random(n) < 0.85, "P", "H"),
+            "feature code": rng.choice(FEATURE_CODES, n),
+            "population": rng.integers(0, 2_000_000, n),
+        }
+        (root / "city_db" / iso).mkdir(exist_ok=True)
+        with open(root / "city_db" / iso / f"{iso}.txt", "w", encoding="utf-8") as file:
+            for i in range(n):
+                row = dict.fromkeys(COLUMNS, "")
+                row.update(
+                    geonameid=str(rows["geonameid"][i]),
+                    name=rows["name"][i],
+                    asciiname=rows["name"][i],
+                    alternatenames=f"{rows['name'][i]} Alt",
+                    latitude=str(rows["latitude"][i]),
+                    longitude=str(rows["longitude"][i]),
+                    **{
+                        "feature class": rows["feature class"][i],
+                        "feature code": rows["feature code"][i],
+                        "country code": iso,
+                        "admin1 code": f"{i % 64:02d}",
+                        "population": str(rows["population"][i]),
+                        "timezone": "Europe/Paris",
+                        "modification date": "2024-01-01",
+                    },
+                )
+                file.write("\t".join(row.values()) + "\n")
+
+
+def _write_features(root: Path, cells: list, params: dict, rng):
+    """Custom features: random-walk 'highways' across the map extent"""
+    x0 = min(x[2] for x in cells)
+    y0 = min(x[3] for x in cells)
+    x1 = max(x[4] for x in cells)
+    y1 = max(x[5] for x in cells)
+    features = []
+    for i in range(params["feature_lines"]):
+        start = rng.uniform([x0, y0], [x1, y1])
+        steps = rng.normal(0, 0.05, (params["vertices"], 2)).cumsum(axis=0)
+        line = np.clip(start + steps, [x0, y0], [x1, y1])
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {"name": f"Highway {i + 1}"},
+                "geometry": {"type": "LineString", "coordinates": np.round(line, 6).tolist()},
+            }
+        )
+    with open(root / "features" / "feature_1.geojson", "w", encoding="utf-8") as file:
+        json.dump({"type": "FeatureCollection", "features": features}, file)
+
+
+def scenario_content(params: dict):
+    """Map content exercising every stage: all countries, regions, cities and label adjustments"""
+    countries = [x[0] for x in _names(params["countries"])]
+    positions = ["top left", "middle right", "bottom center", "top right"]
+    return {
+        "country_list": countries,
+        "subnat_list": [],
+        "city_list": [
+            [f"Town {i}", positions[i % len(positions)]] for i in range(params["cities"])
+        ],
+        "irregular_markers": [
+            {"name": f"Site {i}", "lon": ORIGIN[0] + i, "lat": ORIGIN[1] - 1, "position": "middle right"}
+            for i in range(3)
+        ],
+        "label_adjusts": [[x, "top", 2, 1.2] for x in countries[:5]]
+        + [[countries[0], "left", 1, 0]],
+    }
+
+
+def make_fixtures(root: Path, params: dict, store: bool = True, seed: int = 0):
+    """(Re)writes the fixtures for params under root unless they are already there"""
+    root = Path(root)
+    # A store of an older format would be ignored by MapData; the fixtures are rebuilt instead
+    stamp = dict(params, store=STORE_VERSION if store else False, seed=seed)
+    try:
+        with open(root / "params.json", "r", encoding="utf-8") as file:
+            if json.load(file) == stamp:
+                return root
+    except (OSError, ValueError):
+        pass
+
+    shutil.rmtree(root, ignore_errors=True)
+    rng = np.random.default_rng(seed)
+    cells = _write_geometry(root, params)
+    _write_places(root, cells, params, rng)
+    _write_features(root, cells, params, rng)
+    if store:
+        compile_store(root / "maps")
+
+    # Written last; an interrupted run is regenerated
+    with open(root / "params.json", "w", encoding="utf-8") as file:
+        json.dump(stamp, file)
+    return root
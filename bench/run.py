@@ -0,0 +1,195 @@
+"""Benchmarks the MapBuilder pipeline stage by stage on synthetic fixtures (no network needed).
+
+    python -m bench.run [-scenarios small+medium+continent] [-repeat 5] [-out results.json]
+                        [-fixtures dir] [-nostore] [-compare previous.json]
+
+Each repetition renders the scenario twice: "cold" (fresh MapData, timed as the open_data stage, GeoNames and custom feature
+caches removed, so dataset load, city ingest and feature parsing are paid in full) and "warm" (reusing the MapData, as batch.py
+and server.py do). Stage times come from MapBuilder.stage_times plus figure serialization;
+the median, min and max over the repetitions are written as JSON.
+"""
+import copy
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+import mapper
+from bench.fixtures import SCENARIOS, make_fixtures, scenario_content
+
+
+def _render(data: mapper.MapData, params: dict):
+    """Builds and serializes one scenario map; returns (stage times, counts)"""
+    settings = copy.deepcopy(mapper.map_settings)
+    settings.update(
+        nat_label_toggle=True,
+        subnat_toggle=True,
+        subnat_label_toggle=True,
+        city_toggle=True,
+        irregular_feature_toggle=True,
+        zoom=None,
+        output_path=None,
+        display_toggle=False,
+    )
+    t = time.perf_counter()
+    m = mapper.MapBuilder(
+        "benchmark",
+        settings,
+        scenario_content(params),
+        copy.deepcopy(mapper.map_styling),
+        data=data,
+    )
+    fig = m.draw_map()
+    t_serialize = time.perf_counter()
+    payload = fig.to_json()
+    end = time.perf_counter()
+
+    stages = dict(m.stage_times, serialize=end - t_serialize, total=end - t)
+    counts = {
+        "traces": len(fig.data),
+        "figure_bytes": len(payload.encode("utf-8")),
+        "countries": len(m.nat_db["features"]),
+        "subnats": len(m.subnat_db["features"]) if m.subnat_db is not None else 0,
+        "tier": m.tier,
+    }
+    return stages, counts
+
+
+def _summary(runs: list):
+    """Median/min/max of each stage over the repetitions"""
+    out = {}
+    for stage in runs[0]:
+        values = np.array([x[stage] for x in runs])
+        out[stage] = {
+            "median": float(np.median(values)),
+            "min": float(values.min()),
+            "max": float(values.max()),
+        }
+    return out
+
+
+def run_scenario(root: Path, params: dict, repeat: int):
+    # Discarded run; pays the one-off import and plotly validator costs
+    _render(mapper.MapData(root), params)
+
+    cold, warm = [], []
+    for i in range(repeat):
+        # Drop the ingested GeoNames caches and the custom feature cache so the cold run parses the dumps and features again
+        for x in (root / "city_db").glob("*/places"):
+            shutil.rmtree(x)
+        shutil.rmtree(root / "features" / ".cache", ignore_errors=True)
+        # Opening the MapData (geometry store) is part of the cold cost; it has its own stage and counts toward the total
+        t = time.perf_counter()
+        data = mapper.MapData(root)
+        open_data = time.perf_counter() - t
+        stages, counts = _render(data, params)
+        stages = dict(open_data=open_data, **stages)
+        stages["total"] += open_data
+        cold.append(stages)
+        stages, counts = _render(data, params)
+        warm.append(stages)
+    return {
+        "params": params,
+        "counts": counts,
+        "cold": _summary(cold),
+        "warm": _summary(warm),
+    }
+
+
+def _environment():
+    import pandas as pd
+    import plotly
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "plotly": plotly.__version__,
+    }
+
+
+def compare(results: dict, previous: dict):
+    """Prints the warm/cold median of each stage against a previous results file"""
+    for name, scenario in results["scenarios"].items():
+        if name not in previous["scenarios"]:
+            continue
+        for mode in ["cold", "warm"]:
+            before = previous["scenarios"][name][mode]
+            for stage, now in scenario[mode].items():
+                if stage not in before:
+                    continue
+                ratio = now["median"] / before[stage]["median"] if before[stage]["median"] > 0 else float("nan")
+                print(
+                    f"{name:10} {mode:5} {stage:18} {before[stage]['median'] * 1000:9.1f}ms -> {now['median'] * 1000:9.1f}ms ({ratio:5.2f}x)"
+                )
+
+
+if __name__ == "__main__":
+    scenarios = list(SCENARIOS)
+    repeat = 5
+    out_path = None
+    fixtures = Path(tempfile.gettempdir()) / "plotly_mapper_bench"
+    store = True
+    previous = None
+
+    if "-scenarios" in sys.argv:
+        scenarios_index = sys.argv.index("-scenarios")
+        scenarios = sys.argv[scenarios_index + 1].split("+")
+    if "-repeat" in sys.argv:
+        repeat_index = sys.argv.index("-repeat")
+        repeat = int(sys.argv[repeat_index + 1])
+    if "-out" in sys.argv:
+        out_index = sys.argv.index("-out")
+        out_path = Path(sys.argv[out_index + 1])
+    if "-fixtures" in sys.argv:
+        fixtures_index = sys.argv.index("-fixtures")
+        fixtures = Path(sys.argv[fixtures_index + 1])
+    if "-nostore" in sys.argv:
+        store = False
+    if "-compare" in sys.argv:
+        compare_index = sys.argv.index("-compare")
+        with open(sys.argv[compare_index + 1], "r", encoding="utf-8") as file:
+            previous = json.load(file)
+
+    warnings.filterwarnings("ignore")
+
+    results = {"environment": _environment(), "repeat": repeat, "store": store, "scenarios": {}}
+    for name in scenarios:
+        params = SCENARIOS[name]
+        t = time.perf_counter()
+        root = make_fixtures(fixtures / (name if store else f"{name}_nostore"), params, store=store)
+        print(f"{name}: fixtures ready in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+        results["scenarios"][name] = run_scenario(root, params, repeat)
+        print(
+            f"{name}: cold {results['scenarios'][name]['cold']['total']['median']:.3f}s, warm {results['scenarios'][name]['warm']['total']['median']:.3f}s",
+            file=sys.stderr,
+        )
+
+    if previous is not None:
+        compare(results, previous)
+
+    payload = json.dumps(results, indent=2)
+    if out_path is not None:
+        with open(out_path, "w", encoding="utf-8") as file:
+            file.write(payload)
+    else:
+        print(payload)
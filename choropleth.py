@@ -0,0 +1,147 @@
+"""Choropleth data pipeline: per-region aggregates of large CSV files, joined to country/admin-1 geometry.
+
+CSVs are read in chunks holding only the region (and value) column, each chunk is reduced to
+per-region partial statistics with one groupby, and the partials are combined at the end, so
+memory is bounded by the chunk size and the number of regions rather than the number of rows.
+Aggregates are joined to the features of a map through the name/ISO indexes built over them
+(see geostore.build_index), with a single merge.
+
+Given a date column, rows are also bucketed by period (week, month, ...) and the aggregate is a
+region by period table: one column per animation frame.
+"""
+import numpy as np
+
+
+# Rows per CSV chunk
+CHUNK_ROWS = 500_000
+
+# Partial statistics each aggregation is combined from, and how partials combine
+AGGREGATIONS = {
+    "sum": ["sum"],
+    "mean": ["sum", "count"],
+    "count": ["size"],
+    "min": ["min"],
+    "max": ["max"],
+}
+COMBINE = {"sum": "sum", "count": "sum", "size": "sum", "min": "min", "max": "max"}
+
+# Feature properties a region id in the csv is matched against, in order of preference
+JOIN_KEYS = {
+    "nat": ["ADMIN", "ISO_A3"],
+    "subnat": ["iso_3166_2", "name"],
+}
+
+# Property shown as the name of a region on hover
+NAME_KEYS = {"nat": "ADMIN", "subnat": "name"}
+
+
+def _buckets(column, period: str = None):
+    """Frame label of each value of a date column: the start date of its period (a pandas frequency such as W or M), or the value itself"""
+    import pandas as pd
+
+    if period is None:
+        return column
+    # Dates repeat heavily; parse each distinct value once
+    uniques = pd.Series(column.unique())
+    labels = (
+        pd.to_datetime(uniques).dt.to_period(period).dt.start_time.dt.strftime("%Y-%m-%d")
+    )
+    return column.map(dict(zip(uniques, labels)))
+
+
+def aggregate_csv(
+    paths: list,
+    key: str,
+    value: str = None,
+    how: str = "sum",
+    time: str = None,
+    period: str = None,
+    chunk_rows: int = CHUNK_ROWS,
+):
+    """Aggregate of the value column per region (key column) over CSV files; a float Series indexed by region id
+
+    how is one of AGGREGATIONS; count counts rows and needs no value column. Given a date column (time), the result is
+    a DataFrame instead, indexed by region with one column per period (see _buckets), in date order.
+    """
+    import pandas as pd
+
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation: {how} (expected one of {', '.join(AGGREGATIONS)})")
+    if value is None and how != "count":
+        raise ValueError(f"The {how} aggregation needs a value column")
+    stats = AGGREGATIONS[how]
+    columns = [key] if how == "count" else [key, value]
+    dtypes = {key: str} if how == "count" else {key: str, value: "float64"}
+    if time is not None:
+        columns.append(time)
+        dtypes[time] = str
+
+    partials = []
+    for path in paths:
+        chunks = pd.read_csv(
+            path, usecols=columns, dtype=dtypes, chunksize=chunk_rows, encoding="utf-8-sig"
+        )
+        for chunk in chunks:
+            by = [chunk[key]]
+            if time is not None:
+                by.append(_buckets(chunk[time], period).rename("frame"))
+            groups = chunk.groupby(by, sort=False)
+            if how == "count":
+                partials.append(groups.size().to_frame("size"))
+            else:
+                partials.append(groups[value].agg(stats))
+
+    if len(partials) == 0:
+        out = pd.Series(dtype="float64")
+        return out if time is None else out.to_frame().iloc[:, :0]
+    levels = list(range(partials[0].index.nlevels))
+    combined = (
+        pd.concat(partials).groupby(level=levels, sort=False).agg({x: COMBINE[x] for x in stats})
+    )
+    if how == "mean":
+        out = combined["sum"] / combined["count"]
+    else:
+        out = combined[stats[0]]
+    out = out.astype("float64")
+    if time is not None:
+        # Regions by frame; periods without rows for a region are NaN
+        out = out.unstack(level=1).sort_index(axis=1)
+    return out
+
+
+def join_regions(values, index: dict, keys: list):
+    """Matches per-region values (a Series, or a DataFrame of frames) to feature positions through a layer index
+    ({key: {value: [positions]}}, see geostore.build_index); returns (positions, values) as arrays, rows in the order
+    of positions, each feature matched once (first key first)
+    """
+    import pandas as pd
+
+    lookup = pd.DataFrame(
+        [
+            (region, no, rank)
+            for rank, key in enumerate(keys)
+            for region, positions in index[key].items()
+            for no in positions
+        ],
+        columns=["region", "position", "rank"],
+    )
+    frame = pd.DataFrame({"region": values.index.astype(str), "row": np.arange(len(values))})
+    matched = (
+        frame.merge(lookup, on="region", how="inner")
+        .sort_values(["rank", "position"], kind="stable")
+        .drop_duplicates(subset=["position"], keep="first")
+        .sort_values("position")
+    )
+    rows = matched["row"].to_numpy(dtype="int64")
+    return matched["position"].to_numpy(dtype="int64"), values.to_numpy(dtype="float64")[rows]
+
+
+def region_filter(features: list, positions, names: list, keys: list):
+    """Mask over positions keeping the features whose indexed properties (keys) hold one of names; all of them if names is empty"""
+    if len(names) == 0:
+        return np.ones(len(positions), dtype=bool)
+    names = set(names)
+    return np.array(
+        [any(features[no]["properties"].get(x) in names for x in keys) for no in positions],
+        dtype=bool,
+    )
@@ -0,0 +1,289 @@
+"""Streaming reader for custom feature files (features/feature_*).
+
+Road or pipeline networks can run to hundreds of MB, so features are read one at a time
+instead of json-loading the whole document, and turned into coordinate buffers in batches.
+Supported layouts:
+
+- GeoJSON FeatureCollections (.geojson/.json): parsed with ijson when it is installed,
+  otherwise by an incremental json decoder over the "features" array;
+- newline-delimited GeoJSON (.geojsonl, .ndjson, .geojsons; one feature per line, RFC 8142
+  record separators allowed).
+
+Features outside a bounding box (the map's country extent) can be dropped as they are read.
+
+FeatureCache keeps the crunched coordinate buffers of each file on disk, keyed by the file's
+size, mtime and content hash, so an unchanged file is only ever parsed once.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from geostore import build_coords, features_bounds, simplify_features
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+CACHE_VERSION = 1
+
+NDJSON_SUFFIXES = [".geojsonl", ".ndjson", ".geojsons", ".jsonl"]
+
+# Features converted to coordinates per batch
+BATCH_SIZE = 2000
+
+CHUNK_SIZE = 1 << 20
+
+_FEATURES_KEY = re.compile(r'"features"\s*:\s*\[')
+
+
+def _ndjson_features(file):
+    for line in file:
+        line = line.strip().lstrip("\x1e")
+        if len(line) == 0:
+            continue
+        obj = json.loads(line)
+        if obj.get("type") == "FeatureCollection":
+            yield from obj["features"]
+        else:
+            yield obj
+
+
+def _scan_features(file, chunk_size: int = CHUNK_SIZE):
+    """Yields the members of a FeatureCollection's "features" array, decoding one object at a time"""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size)
+    eof = len(buffer) == 0
+
+    # Find the start of the features array
+    match = _FEATURES_KEY.search(buffer)
+    while match is None and not eof:
+        more = file.read(chunk_size)
+        eof = len(more) == 0
+        buffer += more
+        match = _FEATURES_KEY.search(buffer)
+    if match is None:
+        # Not a FeatureCollection; a lone feature is small enough to decode whole
+        obj = json.loads(buffer)
+        if obj.get("type") == "Feature":
+            yield obj
+        return
+
+    pos = match.end()
+    while True:
+        # Skip separators
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            if pos >= len(buffer):
+                raise ValueError
+            obj, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # Object runs past the buffer; read on (at least doubling, so huge features don't re-parse quadratically)
+            if eof:
+                raise ValueError(f"Truncated feature array in {file.name}")
+            buffer = buffer[pos:]
+            pos = 0
+            more = file.read(max(chunk_size, len(buffer)))
+            eof = len(more) == 0
+            buffer += more
+            continue
+        yield obj
+        pos = end
+
+
+def _intersects(a: list, b: list):
+    return not (a[2] < b[0] or a[0] > b[2] or a[3] < b[1] or a[1] > b[3])
+
+
+def iter_features(path, bounds: list = None):
+    """Yields the features of a file one at a time, skipping those without geometry or outside bounds ([min lon, min lat, max lon, max lat])"""
+    ndjson = str(path).lower().endswith(tuple(NDJSON_SUFFIXES))
+    if ndjson or ijson is None:
+        file = open(path, "r", encoding="utf-8")
+        features = _ndjson_features(file) if ndjson else _scan_features(file)
+    else:
+        file = open(path, "rb")
+        features = ijson.items(file, "features.item", use_float=True)
+
+    with file:
+        for feature in features:
+            if feature.get("geometry") is None:
+                continue
+            if bounds is not None:
+                feature_bounds = features_bounds([feature])
+                if feature_bounds is None or not _intersects(feature_bounds, bounds):
+                    continue
+            yield feature
+
+
+def _batches(features, size: int):
+    batch = []
+    for feature in features:
+        batch.append(feature)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def read_features(path, bounds: list = None, tolerance: float = 0):
+    """Features of a file within bounds, simplified to tolerance"""
+    out = []
+    for batch in _batches(iter_features(path, bounds), BATCH_SIZE):
+        out.extend(simplify_features(batch, tolerance))
+    return out
+
+
+def crunch_features(path, bounds: list = None, tolerance: float = 0, holes: bool = False):
+    """Streams a file into NaN-separated coordinate buffers (see geostore.build_coords)
+
+    Returns a dict of lons/lats, the start of each feature in them (offsets, one more than the feature count) and each
+    feature's [min lon, min lat, max lon, max lat] (bounds).
+    """
+    lons, lats, sizes = [], [], []
+    for batch in _batches(iter_features(path, bounds), BATCH_SIZE):
+        for feature in simplify_features(batch, tolerance):
+            coords = build_coords([feature], holes=holes)
+            if np.isnan(coords[0]).all():
+                continue
+            lons.append(coords[0])
+            lats.append(coords[1])
+            sizes.append(len(coords[0]))
+
+    offsets = np.zeros(len(sizes) + 1, dtype="int64")
+    np.cumsum(sizes, out=offsets[1:])
+    if len(sizes) == 0:
+        return {
+            "lons": np.zeros(0),
+            "lats": np.zeros(0),
+            "offsets": offsets,
+            "bounds": np.zeros((0, 4)),
+        }
+    lons, lats = np.concatenate(lons), np.concatenate(lats)
+    # fmin/fmax skip the NaN separators
+    starts = offsets[:-1]
+    return {
+        "lons": lons,
+        "lats": lats,
+        "offsets": offsets,
+        "bounds": np.column_stack(
+            [
+                np.fmin.reduceat(lons, starts),
+                np.fmin.reduceat(lats, starts),
+                np.fmax.reduceat(lons, starts),
+                np.fmax.reduceat(lats, starts),
+            ]
+        ),
+    }
+
+
+def select_coords(crunched: dict, bounds: list = None):
+    """[lons, lats] of the crunched features overlapping bounds (all of them if None) and their count"""
+    if bounds is None:
+        return [crunched["lons"], crunched["lats"]], len(crunched["offsets"]) - 1
+    fb = crunched["bounds"]
+    rows = np.flatnonzero(
+        ~(
+            (fb[:, 2] < bounds[0])
+            | (fb[:, 0] > bounds[2])
+            | (fb[:, 3] < bounds[1])
+            | (fb[:, 1] > bounds[3])
+        )
+    )
+    offsets = crunched["offsets"]
+    if len(rows) == len(offsets) - 1:
+        return [crunched["lons"], crunched["lats"]], len(rows)
+    index = np.concatenate(
+        [np.arange(offsets[x], offsets[x + 1]) for x in rows] + [np.zeros(0, dtype="int64")]
+    )
+    return [np.asarray(crunched["lons"])[index], np.asarray(crunched["lats"])[index]], len(rows)
+
+
+def _file_hash(path: Path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """On-disk cache of crunched feature files (features/.cache)
+
+    Each source file gets a directory holding its stamp (size, mtime, content hash) and one set of arrays per level of
+    detail/hole setting. A file whose size or mtime changed is rehashed; only if the content changed are its arrays
+    dropped and rebuilt. Files are independent, so one edited file never invalidates the others.
+    """
+
+    def __init__(self, cache_path: Path):
+        self.cache_path = Path(cache_path)
+
+    def _entry(self, path: Path):
+        """Cache directory of a source file, emptied first if the file's content changed"""
+        path = Path(path)
+        entry = self.cache_path / path.name
+        stat = os.stat(path)
+        stamp = {"version": CACHE_VERSION, "size": stat.st_size, "mtime": stat.st_mtime}
+
+        try:
+            with open(entry / "meta.json", "r", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            meta = {}
+        if all(meta.get(x) == stamp[x] for x in stamp):
+            return entry
+
+        # Touched or rewritten: only a different hash means the crunched arrays are stale
+        stamp["hash"] = _file_hash(path)
+        if meta.get("hash") != stamp["hash"] or meta.get("version") != CACHE_VERSION:
+            shutil.rmtree(entry, ignore_errors=True)
+        os.makedirs(entry, exist_ok=True)
+        tmp = entry / f".meta.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as meta_file:
+            json.dump(stamp, meta_file)
+        os.replace(tmp, entry / "meta.json")
+        return entry
+
+    def crunched(self, path: Path, tolerance: float = 0, holes: bool = False):
+        """Crunched arrays of a whole file (see crunch_features), memory-mapped from the cache or built and stored"""
+        try:
+            entry = self._entry(path)
+        except OSError:
+            # Read-only features directory; crunch without caching
+            return crunch_features(path, None, tolerance, holes)
+        variant = entry / f"t{tolerance:g}_h{int(holes)}"
+        try:
+            return {
+                x: np.load(variant / f"{x}.npy", mmap_mode="r")
+                for x in ["lons", "lats", "offsets", "bounds"]
+            }
+        except (OSError, ValueError):
+            pass
+
+        crunched = crunch_features(path, None, tolerance, holes)
+        tmp = entry / f".{variant.name}.{os.getpid()}.tmp"
+        try:
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for key, values in crunched.items():
+                np.save(tmp / f"{key}.npy", values)
+            # Moved into place as a whole; readers never see a partial variant
+            os.replace(tmp, variant)
+        except OSError:
+            # Another process stored it first, or the cache isn't writable
+            shutil.rmtree(tmp, ignore_errors=True)
+        return crunched
+
+    def coords(self, path: Path, bounds: list = None, tolerance: float = 0, holes: bool = False):
+        """[lons, lats] and feature count of the features of a file overlapping bounds"""
+        return select_coords(self.crunched(path, tolerance, holes), bounds)
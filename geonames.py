@@ -0,0 +1,260 @@
+"""Download and local cache of GeoNames populated places.
+
+Missing country dumps are fetched by fetch_geonames(), concurrently and resumably, from
+download.geonames.org or from a mirror (a local directory of <ISO>.zip files or any base
+URL serving them).
+
+The first time a country's dump (city_db/<ISO>/<ISO>.txt) is used, the feature class P
+rows are ingested into a compact columnar cache (city_db/<ISO>/places/) holding only the
+columns needed for plotting markers. Later runs memory-map the cache and decode only the
+rows matching the requested city names.
+"""
+import csv
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from zipfile import BadZipFile, ZipFile
+
+import numpy as np
+
+
+CACHE_VERSION = 1
+
+GEONAMES_URL = "https://download.geonames.org/export/dump/"
+
+# Full column layout of a GeoNames dump
+COLUMNS = [
+    "geonameid",
+    "name",
+    "asciiname",
+    "alternatenames",
+    "latitude",
+    "longitude",
+    "feature class",
+    "feature code",
+    "country code",
+    "cc2",
+    "admin1 code",
+    "admin2 code",
+    "admin3 code",
+    "admin4 code",
+    "population",
+    "elevation",
+    "dem",
+    "timezone",
+    "modification date",
+]
+
+# Variable-length text columns; stored as a utf-8 blob plus offsets, with a hash column for matching
+TEXT_COLUMNS = ["name", "asciiname"]
+
+# Fixed-width columns: dtype in the cache
+FIXED_COLUMNS = {
+    "latitude": "float64",
+    "longitude": "float64",
+    "feature code": "S10",
+    "country code": "S2",
+    "admin1 code": "S20",
+    "population": "int64",
+}
+
+CACHE_COLUMNS = TEXT_COLUMNS + list(FIXED_COLUMNS)
+
+
+def _fname(column: str):
+    return column.replace(" ", "_")
+
+
+def _name_hash(values):
+    """Stable 64-bit hash of each name (python's hash() is salted per process)"""
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(x.encode("utf-8"), digest_size=8).digest(), "little")
+            for x in values
+        ),
+        dtype="uint64",
+        count=len(values),
+    )
+
+
+def _source_stamp(path: Path):
+    stat = os.stat(path)
+    return {"version": CACHE_VERSION, "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _download(url: str, part_path: Path, chunk_size: int):
+    """Streams url into part_path, resuming from whatever a previous attempt left behind"""
+    import requests
+
+    done = part_path.stat().st_size if part_path.exists() else 0
+    headers = {"Range": f"bytes={done}-"} if done > 0 else {}
+
+    with requests.get(url, stream=True, headers=headers, timeout=60) as r:
+        # Nothing left to fetch; the zip check below decides whether the part file is whole
+        if r.status_code == 416:
+            return
+        r.raise_for_status()
+
+        if r.status_code == 206:
+            mode = "ab"
+            total = int(r.headers["Content-Range"].split("/")[-1])
+        else:
+            # Server ignored the range request; start over
+            mode = "wb"
+            total = int(r.headers["Content-Length"]) if "Content-Length" in r.headers else None
+
+        with open(part_path, mode) as file:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+
+    if total is not None and part_path.stat().st_size != total:
+        raise IOError(f"Incomplete download of {url}; rerun to resume")
+
+
+def _fetch_one(iso_code: str, city_db_path: Path, source: str, chunk_size: int):
+    """Fetches and extracts one country's dump into city_db/<ISO>; the directory only appears once complete"""
+    part_path = city_db_path / f"{iso_code}.zip.part"
+    tmp_dir = city_db_path / f".{iso_code}.tmp"
+    save_dir = city_db_path / iso_code
+
+    if source.startswith(("http://", "https://")):
+        _download(source.rstrip("/") + f"/{iso_code}.zip", part_path, chunk_size)
+    else:
+        shutil.copyfile(Path(source) / f"{iso_code}.zip", part_path)
+
+    # Verify the archive before anything is extracted; a corrupt part file is discarded
+    try:
+        with ZipFile(part_path, "r") as zf:
+            if zf.testzip() is not None:
+                raise BadZipFile(f"Corrupt member in {iso_code}.zip")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            zf.extractall(tmp_dir)
+    except BadZipFile:
+        os.remove(part_path)
+        raise
+
+    # Leftovers of an interrupted run (empty or partial directory) are replaced
+    shutil.rmtree(save_dir, ignore_errors=True)
+    os.replace(tmp_dir, save_dir)
+    os.remove(part_path)
+
+
+def fetch_geonames(
+    iso_codes: list,
+    city_db_path: Path,
+    mirror: str = None,
+    workers: int = 4,
+    chunk_size: int = 1 << 20,
+):
+    """Makes sure city_db/<ISO>/<ISO>.txt exists for each code, downloading the missing ones concurrently"""
+    city_db_path = Path(city_db_path)
+    missing = [
+        x for x in dict.fromkeys(iso_codes) if not (city_db_path / x / f"{x}.txt").exists()
+    ]
+    if len(missing) == 0:
+        return []
+
+    source = str(mirror) if mirror else GEONAMES_URL
+    with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+        futures = [
+            pool.submit(_fetch_one, x, city_db_path, source, chunk_size) for x in missing
+        ]
+        # Surface the first failure only after every download has had its chance to finish
+        errors = [x.exception() for x in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return missing
+
+
+def ingest_places(txt_path: Path, cache_dir: Path):
+    """Parses a GeoNames dump once and writes the populated places (feature class P) to cache_dir"""
+    import pandas as pd
+
+    df = pd.read_csv(
+        txt_path,
+        encoding="utf-8",
+        sep="\t",
+        names=COLUMNS,
+        usecols=CACHE_COLUMNS + ["feature class"],
+        dtype={x: str for x in TEXT_COLUMNS + ["feature class", "feature code", "country code", "admin1 code"]},
+        keep_default_na=False,  # 'NA' is Namibia, not a missing value
+        quoting=csv.QUOTE_NONE,  # GeoNames dumps are unquoted; stray quotes are part of the names
+        low_memory=False,
+    )
+    df = df.loc[df["feature class"] == "P"]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for column in TEXT_COLUMNS:
+        encoded = [x.encode("utf-8") for x in df[column]]
+        offsets = np.zeros(len(encoded) + 1, dtype="int64")
+        np.cumsum([len(x) for x in encoded], out=offsets[1:])
+        np.save(cache_dir / f"{_fname(column)}.npy", np.frombuffer(b"".join(encoded), dtype="uint8"))
+        np.save(cache_dir / f"{_fname(column)}_offsets.npy", offsets)
+        np.save(cache_dir / f"{_fname(column)}_hash.npy", _name_hash(df[column].tolist()))
+    for column, dtype in FIXED_COLUMNS.items():
+        values = df[column]
+        if dtype.startswith("S"):
+            values = values.str.encode("utf-8")
+        else:
+            values = pd.to_numeric(values, errors="coerce").fillna(0)
+        np.save(cache_dir / f"{_fname(column)}.npy", values.to_numpy().astype(dtype))
+
+    # Stamp is written last; a partially written cache is never considered current
+    with open(cache_dir / "meta.json", "w", encoding="utf-8") as meta_file:
+        json.dump(_source_stamp(txt_path), meta_file)
+
+
+def load_places(iso_dir: Path, iso_code: str):
+    """Memory-maps the places cache for an ISO code, (re)building it from the dump if stale"""
+    iso_dir = Path(iso_dir)
+    txt_path = iso_dir / f"{iso_code}.txt"
+    cache_dir = iso_dir / "places"
+
+    try:
+        with open(cache_dir / "meta.json", "r", encoding="utf-8") as meta_file:
+            current = json.load(meta_file) == _source_stamp(txt_path)
+    except (OSError, ValueError):
+        current = False
+    if not current:
+        ingest_places(txt_path, cache_dir)
+
+    places = {}
+    for column in TEXT_COLUMNS:
+        for suffix in ["", "_offsets", "_hash"]:
+            places[column + suffix] = np.load(
+                cache_dir / f"{_fname(column)}{suffix}.npy", mmap_mode="r"
+            )
+    for column in FIXED_COLUMNS:
+        places[column] = np.load(cache_dir / f"{_fname(column)}.npy", mmap_mode="r")
+    return places
+
+
+def select_places(places: dict, names: list):
+    """Returns the cached places whose name or asciiname is in names as a DataFrame"""
+    import pandas as pd
+
+    wanted = set(names)
+    hashes = _name_hash(list(wanted))
+    rows = np.flatnonzero(
+        np.isin(places["name_hash"], hashes) | np.isin(places["asciiname_hash"], hashes)
+    )
+
+    out = {}
+    for column in TEXT_COLUMNS:
+        blob, offsets = places[column], places[column + "_offsets"]
+        out[column] = [
+            bytes(blob[offsets[x] : offsets[x + 1]]).decode("utf-8") for x in rows
+        ]
+    for column, dtype in FIXED_COLUMNS.items():
+        values = np.asarray(places[column][rows])
+        out[column] = (
+            [x.decode("utf-8") for x in values] if dtype.startswith("S") else values
+        )
+
+    df = pd.DataFrame(out, columns=CACHE_COLUMNS)
+    # Hashes only narrow the search; confirm against the decoded names
+    return df.loc[df["name"].isin(wanted) | df["asciiname"].isin(wanted)]
@@ -0,0 +1,471 @@
+"""Compiled binary store for the NaturalEarth template data.
+
+The NaturalEarth geojsons are parsed once by compile_store() and written out as flat
+coordinate arrays partitioned by country, so MapBuilder only memory-maps the pages
+belonging to the countries it is drawing instead of json-loading the whole world.
+
+Each layer is also stored at several levels of detail (TIER_TOLERANCES); pick_tier() chooses
+the coarsest tier whose simplification error stays under a pixel at the target zoom. Borders
+shared by neighbouring regions are simplified once, so the tiers have no gaps or overlaps.
+
+Run `python geostore.py` to (re)build the store after updating the maps directory.
+"""
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# shapely/geopandas are only needed to compile the store or to simplify raw geojson; they are imported where used
+
+
+STORE_VERSION = 5
+
+# Store layer: (NaturalEarth source file, property naming the owning country)
+LAYERS = {
+    "nat": ("naturalearth_countries.geojson", "ADMIN"),
+    "subnat": ("naturalearth.geojson", "admin"),
+}
+
+# Properties indexed per layer (name, ISO code, admin-1 name / code) for dict lookups
+INDEX_KEYS = {
+    "nat": ["ADMIN", "ISO_A3"],
+    "subnat": ["admin", "name", "iso_3166_2"],
+}
+
+GEOM_TYPES = ["Polygon", "MultiPolygon", "LineString", "MultiLineString"]
+
+# Arrays making up the geometry of a layer; each level holds offsets into the next
+ARRAYS = ["coords", "rings", "parts", "geoms", "types"]
+
+# Douglas-Peucker tolerance (degrees) of each level of detail; tier 0 is full resolution
+TIER_TOLERANCES = [0, 0.005, 0.02, 0.08]
+
+# Projection used for feature areas (EASE-Grid 2.0 global, cylindrical equal-area)
+EQUAL_AREA_CRS = "EPSG:6933"
+
+# Mapbox renders 512px tiles; width used to fit an extent when no zoom is given
+TILE_SIZE = 512
+MAP_WIDTH = 1000
+
+
+def _source_stamp(path: Path):
+    """Size and mtime of a source file; used to detect a stale store"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def build_index(features: list, keys: list):
+    """Maps each value of the given properties to the positions of the features holding it"""
+    index = {key: {} for key in keys}
+    for no, feature in enumerate(features):
+        for key in keys:
+            value = feature["properties"].get(key)
+            if value is not None:
+                index[key].setdefault(value, []).append(no)
+    return index
+
+
+def _geometry_parts(geometry: dict):
+    """Normalizes a geojson geometry to a list of parts, each a list of rings"""
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    elif geometry["type"] == "LineString":
+        return [[geometry["coordinates"]]]
+    elif geometry["type"] == "MultiLineString":
+        return [geometry["coordinates"]]
+    return []
+
+
+def build_coords(features: list, holes: bool = False):
+    """Converts geojson features to [lons, lats]: contiguous float64 arrays with a NaN between each ring/line"""
+    rings = []
+    for feature in features:
+        if feature["geometry"] is None:
+            continue
+        polygonal = feature["geometry"]["type"] in ("Polygon", "MultiPolygon")
+        for part in _geometry_parts(feature["geometry"]):
+            # Exterior ring only unless holes are requested
+            rings.extend(part[:1] if polygonal and not holes else part)
+
+    sizes = [len(x) for x in rings]
+    out = np.full((2, sum(sizes) + len(rings)), np.nan)
+    pos = 0
+    for ring, size in zip(rings, sizes):
+        if size > 0:
+            out[:, pos : pos + size] = np.asarray(ring, dtype="float64")[:, :2].T
+        pos += size + 1  # NaN left in place marks the end of a ring
+    return [out[0], out[1]]
+
+
+def _simplify_shared(polygons, tolerance: float):
+    """Simplifies polygons through their shared arcs; None for a polygon whose faces couldn't be rebuilt
+
+    The rings are noded into arcs running between the points where three or more polygons meet, so each shared border
+    is one arc. The arcs are simplified together (no two may cross) and polygonized back into faces, and each face goes
+    to the polygon it overlaps most.
+    """
+    import shapely
+
+    arcs = shapely.line_merge(shapely.union_all(shapely.boundary(polygons)))
+    arcs = shapely.simplify(arcs, tolerance, preserve_topology=True)
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(arcs)))
+
+    valid = shapely.make_valid(polygons)
+    face_no, polygon_no = shapely.STRtree(valid).query(faces, predicate="intersects")
+    overlaps = shapely.area(shapely.intersection(faces[face_no], valid[polygon_no]))
+    owners = {}  # face: (polygon, overlap)
+    for face, polygon, overlap in zip(face_no, polygon_no, overlaps):
+        if overlap > owners.get(face, (None, 0))[1]:
+            owners[face] = (polygon, overlap)
+    parts = [[] for _ in polygons]
+    for face, (polygon, _) in owners.items():
+        parts[polygon].append(faces[face])
+
+    out = []
+    for polygon, polygon_faces in zip(polygons, parts):
+        rebuilt = shapely.union_all(polygon_faces) if len(polygon_faces) > 0 else None
+        # Faces lost to arcs that no longer close (e.g. a ring collapsed by the simplification)
+        if rebuilt is None or abs(rebuilt.area - polygon.area) > polygon.area / 2:
+            rebuilt = None
+        out.append(rebuilt)
+    return out
+
+
+def simplify_features(features: list, tolerance: float):
+    """Topology-preserving simplification of geojson features; polygons that share borders keep sharing them (see _simplify_shared)"""
+    features = [x for x in features if x["geometry"] is not None]
+    if tolerance <= 0 or len(features) == 0:
+        return features
+    import shapely
+    from shapely.geometry import mapping, shape
+
+    geometries = np.array([shape(x["geometry"]) for x in features], dtype=object)
+    is_polygon = np.isin(shapely.get_type_id(geometries), [3, 6])
+    simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    if is_polygon.sum() > 1:
+        try:
+            shared = _simplify_shared(geometries[is_polygon], tolerance)
+        except shapely.errors.GEOSException:
+            # Linework GEOS can't node (e.g. badly self-intersecting rings)
+            shared = [None] * is_polygon.sum()
+        # Polygons that couldn't be rebuilt keep their own simplification
+        simplified[is_polygon] = [
+            x if x is not None else own for x, own in zip(shared, simplified[is_polygon])
+        ]
+    return [
+        dict(x, geometry=mapping(geom)) for x, geom in zip(features, simplified)
+    ]
+
+
+def feature_anchors(features: list):
+    """Sets each feature's label anchor (a point guaranteed inside the shape) and equal-area size in km^2"""
+    features = [x for x in features if x["geometry"] is not None]
+    if len(features) == 0:
+        return features
+    import geopandas as gpd
+    import shapely
+    from shapely.geometry import shape
+
+    geoms = gpd.GeoSeries([shape(x["geometry"]) for x in features], crs="EPSG:4326")
+    anchors = shapely.get_coordinates(geoms.representative_point().values)
+    areas = geoms.to_crs(EQUAL_AREA_CRS).area.to_numpy() / 1e6
+    for feature, anchor, area in zip(features, anchors.tolist(), areas.tolist()):
+        feature["anchor"] = anchor
+        feature["area"] = area
+    return features
+
+
+def features_bounds(features: list):
+    """[min lon, min lat, max lon, max lat] of geojson features"""
+    lons, lats = build_coords(features, holes=False)
+    if np.isnan(lons).all():
+        return None
+    return [
+        float(np.nanmin(lons)),
+        float(np.nanmin(lats)),
+        float(np.nanmax(lons)),
+        float(np.nanmax(lats)),
+    ]
+
+
+def zoom_for_extent(bounds: list, width: int = MAP_WIDTH):
+    """Mapbox zoom at which an extent ([min lon, min lat, max lon, max lat]) fills width pixels"""
+    span = max(bounds[2] - bounds[0], bounds[3] - bounds[1], 1e-6)
+    return float(np.clip(np.log2(360 * width / (TILE_SIZE * span)), 0, 22))
+
+
+def _pixel_degrees(zoom: float, lat: float = 0):
+    # Mercator pixels cover fewer degrees of latitude away from the equator
+    return 360 / (TILE_SIZE * 2**zoom) * np.cos(np.radians(min(abs(lat), 85)))
+
+
+def pick_tier(zoom: float, lat: float = 0):
+    """Coarsest level of detail whose tolerance is below one pixel at the given zoom and latitude"""
+    pixel = _pixel_degrees(zoom, lat)
+    return max(no for no, x in enumerate(TIER_TOLERANCES) if x <= pixel)
+
+
+def coord_precision(zoom: float, lat: float = 0):
+    """Decimal places that keep the rounding error under a quarter pixel at the given zoom and latitude"""
+    return max(int(np.ceil(-np.log10(_pixel_degrees(zoom, lat) / 2))), 0)
+
+
+def compact_coords(lons, lats, decimals: int):
+    """Rounds NaN-separated coordinate arrays and drops vertices repeating the one before them"""
+    lons = np.round(np.asarray(lons, dtype="float64"), decimals)
+    lats = np.round(np.asarray(lats, dtype="float64"), decimals)
+    # NaN never equals NaN, so ring separators are always kept
+    keep = np.ones(len(lons), dtype=bool)
+    keep[1:] = (lons[1:] != lons[:-1]) | (lats[1:] != lats[:-1])
+    return lons[keep], lats[keep]
+
+
+def _write_geometry(tier_dir: Path, features: list):
+    """Writes the flat coordinate/offset arrays for features (already in partition order)"""
+    os.makedirs(tier_dir, exist_ok=True)
+    coords = []
+    rings = [0]
+    parts = [0]
+    geoms = [0]
+    types = []
+    for feature in features:
+        for part in _geometry_parts(feature["geometry"]):
+            for ring in part:
+                coords.extend(x[:2] for x in ring)
+                rings.append(len(coords))
+            parts.append(len(rings) - 1)
+        geoms.append(len(parts) - 1)
+        types.append(GEOM_TYPES.index(feature["geometry"]["type"]))
+
+    np.save(tier_dir / "coords.npy", np.asarray(coords, dtype="float64").reshape(-1, 2))
+    np.save(tier_dir / "rings.npy", np.asarray(rings, dtype="int64"))
+    np.save(tier_dir / "parts.npy", np.asarray(parts, dtype="int64"))
+    np.save(tier_dir / "geoms.npy", np.asarray(geoms, dtype="int64"))
+    np.save(tier_dir / "types.npy", np.asarray(types, dtype="uint8"))
+
+
+def _write_layer(layer_dir: Path, features: list, key: str, index_keys: list):
+    """Writes one layer, grouping features so each country is a contiguous partition"""
+    shutil.rmtree(layer_dir, ignore_errors=True)
+    os.makedirs(layer_dir / "props", exist_ok=True)
+
+    by_country = {}
+    for feature in features:
+        if feature["geometry"] is None:
+            continue
+        by_country.setdefault(feature["properties"][key], []).append(feature)
+
+    countries = {}
+    ordered = []
+    for no, (country, country_features) in enumerate(sorted(by_country.items())):
+        # Properties are sharded per country so a lookup only parses its own slice
+        shard = f"props/{no:04d}.json"
+        with open(layer_dir / shard, "w", encoding="utf-8") as props_file:
+            json.dump([x["properties"] for x in country_features], props_file)
+        countries[country] = {
+            "start": len(ordered),
+            "stop": len(ordered) + len(country_features),
+            "props": shard,
+            "bounds": features_bounds(country_features),
+        }
+        ordered.extend(country_features)
+
+    # Offsets in the index refer to the compiled (partition) order
+    with open(layer_dir / "index.json", "w", encoding="utf-8") as index_file:
+        json.dump(build_index(ordered, index_keys), index_file)
+
+    # Label anchors/areas are computed once, from the full-resolution geometry
+    feature_anchors(ordered)
+    anchors = np.asarray([x["anchor"] for x in ordered], dtype="float64").reshape(-1, 2)
+    np.save(layer_dir / "anchors.npy", anchors)
+    np.save(layer_dir / "areas.npy", np.asarray([x["area"] for x in ordered], dtype="float64"))
+
+    # Every level of detail shares the partition order, offsets and properties
+    for tier, tolerance in enumerate(TIER_TOLERANCES):
+        _write_geometry(layer_dir / f"tier_{tier}", simplify_features(ordered, tolerance))
+
+    return {"countries": countries}
+
+
+def compile_store(map_path: Path, store_path: Path = None):
+    """One-time compile step; converts the NaturalEarth geojsons in map_path into a binary store"""
+    map_path = Path(map_path)
+    store_path = Path(store_path) if store_path is not None else map_path / "store"
+    os.makedirs(store_path, exist_ok=True)
+
+    manifest = {
+        "version": STORE_VERSION,
+        "tiers": TIER_TOLERANCES,
+        "sources": {},
+        "layers": {},
+    }
+    for layer, (fname, key) in LAYERS.items():
+        with open(map_path / fname, "r", encoding="utf-8") as geojson_file:
+            features = json.load(geojson_file)["features"]
+        manifest["layers"][layer] = _write_layer(
+            store_path / layer, features, key, INDEX_KEYS[layer]
+        )
+        manifest["sources"][layer] = _source_stamp(map_path / fname)
+
+    # Manifest goes last so a half-written store is never picked up
+    tmp_path = store_path / "manifest.json.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_path, store_path / "manifest.json")
+
+    return store_path
+
+
+def open_store(map_path: Path, store_path: Path = None):
+    """Returns a GeoStore if a compiled store is present and current, otherwise None"""
+    map_path = Path(map_path)
+    store_path = Path(store_path) if store_path is not None else map_path / "store"
+    try:
+        with open(store_path / "manifest.json", "r", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != STORE_VERSION:
+        return None
+    # Sources may be deleted once compiled; if present they must match what was compiled
+    for layer, (fname, key) in LAYERS.items():
+        source = map_path / fname
+        if source.exists() and manifest["sources"].get(layer) != _source_stamp(source):
+            return None
+
+    return GeoStore(store_path, manifest)
+
+
+class GeoStore:
+    """Read-only view over a compiled store; arrays are memory-mapped on first use"""
+
+    def __init__(self, store_path: Path, manifest: dict):
+        self.path = Path(store_path)
+        self.manifest = manifest
+        self._arrays = {}
+        self._indexes = {}
+        self._props = {}
+
+        # Partition boundaries per layer, for finding the shard holding a given offset
+        self._starts = {}
+        for layer, entry in manifest["layers"].items():
+            partitions = sorted(entry["countries"].values(), key=lambda x: x["start"])
+            self._starts[layer] = (np.array([x["start"] for x in partitions]), partitions)
+
+    def _layer_arrays(self, layer: str, tier: int):
+        if (layer, tier) not in self._arrays:
+            self._arrays[(layer, tier)] = {
+                x: np.load(self.path / layer / f"tier_{tier}" / f"{x}.npy", mmap_mode="r")
+                for x in ARRAYS
+            }
+        return self._arrays[(layer, tier)]
+
+    def _shard(self, layer: str, shard: str):
+        if (layer, shard) not in self._props:
+            with open(self.path / layer / shard, "r", encoding="utf-8") as props_file:
+                self._props[(layer, shard)] = json.load(props_file)
+        return self._props[(layer, shard)]
+
+    def index(self, layer: str):
+        """Persistent name/ISO index of a layer; {key: {value: [offsets]}}"""
+        if layer not in self._indexes:
+            with open(self.path / layer / "index.json", "r", encoding="utf-8") as index_file:
+                self._indexes[layer] = json.load(index_file)
+        return self._indexes[layer]
+
+    def lookup(self, layer: str, value: str, keys: list = None, country_list: list = None):
+        """Offsets of the features whose indexed properties (all by default) equal value; only within the partitions of country_list if given"""
+        index = self.index(layer)
+        out = []
+        for key in keys if keys is not None else INDEX_KEYS[layer]:
+            out.extend(index[key].get(value, []))
+        if country_list is not None:
+            partitions = self.manifest["layers"][layer]["countries"]
+            ranges = [
+                (partitions[x]["start"], partitions[x]["stop"])
+                for x in country_list
+                if x in partitions
+            ]
+            out = [no for no in out if any(start <= no < stop for start, stop in ranges)]
+        return list(dict.fromkeys(out))
+
+    def bounds(self, layer: str, country_list: list):
+        """Combined extent of the given countries, without reading any geometry"""
+        partitions = self.manifest["layers"][layer]["countries"]
+        bounds = [partitions[x]["bounds"] for x in country_list if x in partitions]
+        bounds = [x for x in bounds if x is not None]
+        if len(bounds) == 0:
+            return None
+        bounds = np.asarray(bounds)
+        return bounds[:, :2].min(axis=0).tolist() + bounds[:, 2:].max(axis=0).tolist()
+
+    def _geometry(self, arrays: dict, no: int):
+        """Rebuilds the geojson geometry of feature number no"""
+        coords, rings, parts = arrays["coords"], arrays["rings"], arrays["parts"]
+        out_parts = []
+        for p in range(arrays["geoms"][no], arrays["geoms"][no + 1]):
+            out_parts.append(
+                [
+                    coords[rings[r] : rings[r + 1]].tolist()
+                    for r in range(parts[p], parts[p + 1])
+                ]
+            )
+
+        geom_type = GEOM_TYPES[arrays["types"][no]]
+        if geom_type == "Polygon":
+            coordinates = out_parts[0]
+        elif geom_type == "MultiPolygon":
+            coordinates = out_parts
+        elif geom_type == "LineString":
+            coordinates = out_parts[0][0]
+        else:
+            coordinates = out_parts[0]
+        return {"type": geom_type, "coordinates": coordinates}
+
+    def _anchor_arrays(self, layer: str):
+        if (layer, "anchors") not in self._arrays:
+            self._arrays[(layer, "anchors")] = {
+                x: np.load(self.path / layer / f"{x}.npy", mmap_mode="r")
+                for x in ["anchors", "areas"]
+            }
+        return self._arrays[(layer, "anchors")]
+
+    def features_at(self, layer: str, offsets: list, tier: int = 0):
+        """Geojson features of a layer at the given offsets and level of detail, with their label anchor and area"""
+        starts, partitions = self._starts[layer]
+        arrays = self._layer_arrays(layer, tier)
+        anchors = self._anchor_arrays(layer)
+        out = []
+        for no in offsets:
+            entry = partitions[int(np.searchsorted(starts, no, side="right")) - 1]
+            out.append(
+                {
+                    "type": "Feature",
+                    "properties": self._shard(layer, entry["props"])[no - entry["start"]],
+                    "geometry": self._geometry(arrays, no),
+                    "anchor": anchors["anchors"][no].tolist(),
+                    "area": float(anchors["areas"][no]),
+                }
+            )
+        return out
+
+    def features(self, layer: str, country_list: list, tier: int = 0):
+        """Geojson features of a layer for the given countries, read from their partitions only"""
+        partitions = self.manifest["layers"][layer]["countries"]
+        offsets = []
+        for country in dict.fromkeys(country_list):
+            if country in partitions:
+                offsets.extend(
+                    range(partitions[country]["start"], partitions[country]["stop"])
+                )
+        return self.features_at(layer, offsets, tier)
+
+if __name__ == "__main__":
+    maps_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "maps"
+    print(f"Compiled geometry store at {compile_store(maps_dir)}")
@@ -1,22 +1,37 @@
-import pandas as pd
 import os
-import regex as re
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import json
 import numpy as np
-import geopandas as gpd
 from pathlib import Path
-from shapely.geometry import Point
 from os.path import exists
+import base64
+from collections import OrderedDict
+import threading
+import time
+import tracemalloc
+import cProfile
+import pstats
 import warnings
-import requests
 import sys
-import plotly.io as pio
-from zipfile import ZipFile
-from array import array
-from pandas import json_normalize
+from contextlib import contextmanager
+from geostore import (
+    INDEX_KEYS,
+    LAYERS,
+    TIER_TOLERANCES,
+    build_coords,
+    build_index,
+    compact_coords,
+    coord_precision,
+    feature_anchors,
+    features_bounds,
+    open_store,
+    pick_tier,
+    simplify_features,
+    zoom_for_extent,
+)
+from feature_io import FeatureCache, read_features
+from choropleth import JOIN_KEYS, NAME_KEYS, aggregate_csv, join_regions, region_filter
+from points import aggregate_points, read_points
+from geonames import CACHE_COLUMNS, fetch_geonames, load_places, select_places
 
 
 # Configuration for the map being output
@@ -28,9 +43,37 @@ map_settings = {
     "subnat_highlight_toggle": False,  # specify and highlight a subnat
     "city_toggle": True,  # show cities
     "chloro_toggle": False,  # apply a chloro map
+    "chloro_layer": "subnat",  # regions the csv data is joined to: "nat" (countries) or "subnat" (states/provinces)
+    "chloro_key": "region",  # csv column naming the region of each row (subnat: ISO 3166-2 code or name; nat: name or ISO A3 code)
+    "chloro_value": None,  # csv column aggregated per region (None: rows are counted)
+    "chloro_agg": "sum",  # aggregation of chloro_value per region: sum, mean, count, min or max
+    "chloro_colorscale": "YlOrRd",  # plotly colorscale of the chloro map
+    "chloro_time": None,  # csv date column; animates the chloro map with one frame per period
+    "chloro_period": "W",  # pandas frequency the dates are bucketed into (D, W, M, Q, Y; None: one frame per distinct value)
+    "chloro_frame_duration": 500,  # ms per animation frame
     "csv_toggle": False,  # apply data from a csv file
     "irregular_marker_toggle": False,  # map irregular features onto the map using custom lon/lats (csv or otherwise)
-    "irregular_feature_toggle": True if exists(Path(__file__).parent / 'features/feature_1.geojson') else False #Draw custom highways, etc.; checks features directory
+    "irregular_feature_toggle": True if exists(Path(__file__).parent / 'features/feature_1.geojson') else False, #Draw custom highways, etc.; checks features directory
+    "zoom": 4.12,  # map zoom; None fits the map to the extent of country_list
+    "lod_toggle": True,  # draw borders/features at the level of detail suited to the zoom (see geostore.py)
+    "border_layer_toggle": False,  # draw borders and custom features as mapbox geojson layers instead of scatter traces
+    "feature_extent_toggle": False,  # only load the custom features overlapping the extent of country_list
+    "interior_rings_toggle": False,  # draw interior rings (holes) of polygons as well as their outlines
+    "marker_batch_toggle": True,  # draw markers as one trace per label position rather than one trace per marker
+    "point_cell_size": 24,  # point layers: density cell width / cluster radius in px (see points.py)
+    "point_max_cells": 20_000,  # point layers: most cells or clusters drawn per layer (cells grow until they fit)
+    "point_max_points": 50_000,  # point layers: most points drawn per layer in scatter mode
+    "geonames_mirror": os.getenv("GEONAMES_MIRROR"),  # local directory or base URL holding <ISO>.zip dumps (default: download.geonames.org)
+    "output_path": None,  # write the map to this path (.html, .json, .png, .svg, .pdf, .jpeg, .webp) instead of opening a browser
+    "output_width": None,  # output size in px (None: plotly defaults)
+    "output_height": None,
+    "output_scale": 1,  # static image scale factor
+    "display_toggle": True,  # open the map in the browser when there is no output_path
+    "compact_toggle": False,  # round line coordinates to the zoom's precision, drop repeated vertices and write lat/lon as binary typed arrays (html/json output)
+    "coord_precision": None,  # decimal places kept by compact_toggle (None: from the zoom)
+    "instrument_toggle": False,  # record time, peak memory and counts per stage in MapBuilder.report
+    "profiler": None,  # "cprofile" or "pyinstrument" to profile __init__ and draw_map
+    "profile_path": None,  # profile output (.prof stats for cprofile, .html for pyinstrument); None prints a summary
 }
 
 map_content = {
@@ -42,8 +85,11 @@ map_content = {
     # Format: [label, direction, extent, size_override (0 for unchanged)] / Direction: 'top-right', 'bottom-right', 'right', 'top', etc. / Size: multiplier for adjustment (eg 2 = 2x)
     # Note: For more finicky adjustments run the same country through the list twice.
     "label_adjusts": [[]],
-    # CSV list - nats and subnats for which the csv data will apply to.
+    # CSV list - nats and subnats for which the csv data will apply to (all regions of country_list if empty).
     "csv_list": [],
+    # High-volume point layers (csv or parquet, path relative to the mapper directory); mode: grid, hexbin, cluster or scatter.
+    # Format: {"path": "points/events.csv", "lon": "lon", "lat": "lat", "mode": "hexbin", "name": "Events", "weight": None (column summed instead of counting points)}
+    "point_layers": [],
     # Irregular features comes in dict form for easy importing of outside data sources.
     "irregular_markers": [
         {
@@ -68,6 +114,11 @@ map_styling = {
     "city_text_color": "#241f20",
     "marker_size": 15,
     "marker_color": "#241f20",
+    # POINT LAYERS
+    "point_color": "rgba(202, 52, 51, 0.8)",
+    "point_size": 6,
+    "point_opacity": 0.75,
+    "point_colorscale": "YlOrRd",
     # FEATURES
     "feature_color": "rgba(202, 52, 51, 0.5)",
     "feature_fill_opacity": 0.25,
@@ -83,352 +134,692 @@ map_styling = {
     "subnat_label_color": "#282828",
 }
 
+# GeoNames feature codes for populated places, from most to least significant; used to pick between same-named places
+FEATURE_CODE_RANKS = {"PPLC": 0, "PPLA": 1, "PPLA2": 2, "PPLA3": 3, "PPLA4": 4, "PPL": 5}
+
+# Label sizing: area thresholds (equal-area km^2; about 10/30/50/80/110/150 square degrees at mid-latitudes) and the label size multiplier above each threshold
+# (smaller areas get a fixed size of 10)
+LABEL_SIZE_BINS = [90_000, 260_000, 440_000, 700_000, 960_000, 1_300_000]
+LABEL_SIZE_SCALES = {
+    "nat": [0.35, 0.45, 0.65, 0.8, 1, 1.5],
+    "subnat": [0.5, 0.6, 0.8, 0.9, 1, 1.5],
+}
+
+# Streamed custom feature geojsons (layer mode), choropleth aggregates and point layers kept in memory by a MapData
+FEATURE_CACHE_SIZE = 32
+
+# Trace groups of a map in drawing order; traces are tagged with their group (meta) so update() can redraw them one group at a time
+DRAW_GROUPS = ["chloro", "countries", "subnats", "outlines", "labels", "irregulars", "points", "markers"]
+
+# update(): the groups each key is drawn into. Changing a key not listed here rebuilds the map (from the same MapData)
+REDRAW_GROUPS = {
+    "settings": {
+        "nat_label_toggle": ["labels"],
+        "subnat_label_toggle": ["labels"],
+        "marker_batch_toggle": ["markers"],
+        "point_cell_size": ["points"],
+        "point_max_cells": ["points"],
+        "point_max_points": ["points"],
+        "irregular_marker_toggle": [],
+        "display_toggle": [],
+        "output_path": [],
+        "output_width": [],
+        "output_height": [],
+        "output_scale": [],
+        "coord_precision": ["countries", "subnats", "outlines", "irregulars"],
+        "chloro_colorscale": ["chloro"],
+        "chloro_frame_duration": ["chloro"],
+    },
+    "content": {
+        "label_adjusts": ["labels"],
+        "city_list": ["markers"],
+        "irregular_markers": ["markers"],
+        # Density point layers also decide whether border layers outline their fills (see _outline_on_fill)
+        "point_layers": ["points", "countries", "subnats", "outlines", "irregulars"],
+        "csv_list": ["chloro"],
+    },
+    "styling": {
+        "background_color": ["countries", "subnats", "outlines", "irregulars", "markers"],
+        "nat_border_opacity": ["countries", "outlines", "irregulars"],
+        "nat_border_width": ["countries", "outlines", "irregulars"],
+        "nat_border_color": ["countries", "outlines", "irregulars"],
+        "subnat_border_opacity": ["subnats"],
+        "subnat_border_width": ["subnats"],
+        "subnat_border_color": ["subnats"],
+        "city_text_size": ["markers"],
+        "city_text_color": ["markers"],
+        "marker_size": ["markers"],
+        "marker_color": ["markers"],
+        "point_color": ["points"],
+        "point_size": ["points"],
+        "point_opacity": ["points"],
+        "point_colorscale": ["points"],
+        "feature_color": ["irregulars"],
+        "feature_fill_opacity": ["irregulars"],
+        "feature_border_opacity": ["irregulars"],
+        "feature_border_width": ["irregulars"],
+        "feature_border_color": ["irregulars"],
+        "nat_label_opacity": ["labels"],
+        "nat_label_size": ["labels"],
+        "nat_label_color": ["labels"],
+        "subnat_label_opacity": ["labels"],
+        "subnat_label_size": ["labels"],
+        "subnat_label_color": ["labels"],
+    },
+}
+
+# Static image formats exported through kaleido
+STATIC_FORMATS = ["png", "svg", "pdf", "jpeg", "webp"]
+_renderer_started = False
+_renderer_lock = threading.Lock()
+
+
+class MapData:
+    """Datasets shared read-only by MapBuilder instances (geometry store, ISO table, places caches, custom features); each is loaded once, on first use"""
+
+    def __init__(self, root: Path = Path(__file__).parent):
+        self.root = Path(root)
+        self.map_path = self.root / "maps"
+        self.city_db_path = self.root / "city_db"
+        self.features_path = self.root / "features"
+        self.csv_path = self.root / "csv"
+        self.feature_cache = FeatureCache(self.features_path / ".cache")
+
+        # Compiled binary store (see geostore.py); None if it hasn't been compiled
+        self.store = open_store(self.map_path)
+
+        self._naturalearth = {}
+        self._iso_list = None
+        self._places = {}
+        self._features = OrderedDict()
+        # Guards the lazy loads and downloads when builders run on several threads
+        self._lock = threading.RLock()
+
+    def naturalearth(self, layer: str):
+        """Full NaturalEarth geojson of a layer ("nat" countries, "subnat" admin-1 regions); only used when there is no compiled store"""
+        with self._lock:
+            if layer not in self._naturalearth:
+                with open(
+                    self.map_path / LAYERS[layer][0], "r", encoding="utf-8"
+                ) as geojson_file:
+                    self._naturalearth[layer] = json.load(geojson_file)
+        return self._naturalearth[layer]
+
+    def iso_list(self):
+        """Country name to ISO code table (city_db/cities.csv)"""
+        import pandas as pd
+
+        with self._lock:
+            if self._iso_list is None:
+                self._iso_list = pd.read_csv(
+                    self.city_db_path / "cities.csv", encoding="utf-8"
+                )
+        return self._iso_list
+
+    def fetch_places(self, iso_codes: list, mirror: str = None):
+        """Downloads the missing GeoNames dumps of iso_codes (see geonames.py)"""
+        with self._lock:
+            return fetch_geonames(iso_codes, self.city_db_path, mirror=mirror)
+
+    def places(self, iso_code: str):
+        """Memory-mapped populated places cache of a country (see geonames.py)"""
+        with self._lock:
+            if iso_code not in self._places:
+                self._places[iso_code] = load_places(
+                    self.city_db_path / iso_code, iso_code
+                )
+        return self._places[iso_code]
+
+    def feature_paths(self):
+        """Custom feature files (features/feature_*; geojson or newline-delimited geojson, see feature_io.py)"""
+        if not self.features_path.exists():
+            return []
+        return sorted(
+            self.features_path / x for x in os.listdir(self.features_path) if "feature_" in x
+        )
+
+    def _cached(self, key: tuple, load):
+        """Small LRU of streamed feature files (layer mode), choropleth aggregates and point layers, keyed by file(s) and read parameters"""
+        with self._lock:
+            if key in self._features:
+                self._features.move_to_end(key)
+                return self._features[key]
+            value = load()
+            self._features[key] = value
+            if len(self._features) > FEATURE_CACHE_SIZE:
+                self._features.popitem(last=False)
+            return value
+
+    def features(self, path: Path, bounds: list = None, tolerance: float = 0):
+        """Features of a custom feature file within bounds, simplified to tolerance; reread when the file changes"""
+        stat = os.stat(path)
+        key = ("features", str(path), stat.st_size, stat.st_mtime, tuple(bounds or ()), tolerance)
+        return self._cached(key, lambda: read_features(path, bounds, tolerance))
+
+    def csv_paths(self):
+        """Choropleth data files (csv/csv_*)"""
+        if not self.csv_path.exists():
+            return []
+        return sorted(self.csv_path / x for x in os.listdir(self.csv_path) if "csv_" in x)
+
+    def chloro_values(
+        self, key: str, value: str = None, how: str = "sum", time: str = None, period: str = None
+    ):
+        """Per-region (and per-period, given a date column) aggregate of the choropleth csvs (see choropleth.py); recomputed when a file is added or changes"""
+        paths = self.csv_paths()
+        stamps = tuple((str(x), os.stat(x).st_size, os.stat(x).st_mtime) for x in paths)
+        how = how if value is not None else "count"
+        cache_key = ("chloro", stamps, key, value, how, time, period)
+        return self._cached(
+            cache_key, lambda: aggregate_csv(paths, key, value, how, time, period)
+        )
+
+    def points(self, path: Path, lon: str = "lon", lat: str = "lat", weight: str = None):
+        """lon/lat (and weight) arrays of a point layer file (see points.py); paths are relative to the data root. Reloaded when the file changes"""
+        path = self.root / path
+        stat = os.stat(path)
+        key = ("points", str(path), stat.st_size, stat.st_mtime, lon, lat, weight)
+        return self._cached(key, lambda: read_points(path, lon, lat, weight))
+
+    def feature_coords(self, path: Path, bounds: list = None, tolerance: float = 0, holes: bool = False):
+        """Coordinate buffers ([lons, lats], feature count) of the features of a custom feature file overlapping bounds
+
+        The whole file is crunched once per level of detail and kept in the on-disk feature cache (see feature_io.FeatureCache)
+        """
+        with self._lock:
+            return self.feature_cache.coords(path, bounds, tolerance, holes)
+
+    def warm(self):
+        """Loads the datasets most maps need up front (ISO table, already-ingested places caches, NaturalEarth geojson when there is no store), e.g. before a server or process pool starts"""
+        self.iso_list()
+        if self.city_db_path.exists():
+            for x in sorted(os.listdir(self.city_db_path)):
+                if (self.city_db_path / x / f"{x}.txt").exists():
+                    self.places(x)
+        if self.store is None:
+            self.naturalearth("nat")
+            self.naturalearth("subnat")
+
 
 class MapBuilder:
-    def __init__(self, token: str, settings: dict, content: dict, styling: dict):
+    def __init__(
+        self,
+        token: str,
+        settings: dict,
+        content: dict,
+        styling: dict,
+        data: MapData = None,
+    ):
         # Mapbox token from environmental variable
         self.token = token
         self.config = settings
         self.content = content
         self.styling = styling
 
+        # Shared datasets; pass one MapData to reuse loaded data across many maps
+        self.data = data if data is not None else MapData()
+
+        # Wall time of each pipeline stage in seconds (see _stage)
+        self.stage_times = {}
+
+        # Opt-in instrumentation: per-stage report (see _stage) and/or a profile of __init__ and draw_map
+        self.report = None
+        self._stage_stack = []
+        if self.config["instrument_toggle"] == True:
+            self.report = {"stages": [], "figure_bytes": None, "seconds": 0}
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        self._profiler = None
+        if self.config["profiler"] is not None:
+            self._profiler = _make_profiler(self.config["profiler"])
+        self._profile(True)
+        t_init = time.perf_counter()
+
+        import pandas as pd
+
         # Label DF (For all labeled features including nat, subnat, cities, irregular features)
         self.label_df = pd.DataFrame(
             columns=["name", "centroid", "size", "position", "code", "type"]
         )
 
+        # Crunched countries/subnats and their border coordinates; set by the first draw_map and reused when groups are redrawn (see update)
+        self.nat_features = None
+        self.external_borders = None
+        self.subnat_features = None
+        self.internal_borders = None
+        # Merged polygon/line geometry of each dataset drawn as mapbox layers (see _layer_geometry)
+        self.layer_geometry = {}
+
         # Load Natural Earth data (serves as template for custom maps)
-        map_path = Path(__file__).parent / "maps/"
-        city_db_path = Path(__file__).parent / "city_db/"
-        with open(
-            map_path / "naturalearth.geojson", "r", encoding="utf-8"
-        ) as geojson_file:
-            self.countries = json.load(geojson_file)
-        with open(
-            map_path / "naturalearth_countries.geojson", "r", encoding="utf-8"
-        ) as geojson_file:
-            self.borders = json.load(geojson_file)
-
-        # Store a collection of the specific geojson data we're using so as to avoid re-iterating the NaturalEarth set.
-        init_slice = []
-        for i in self.borders["features"]:
-            if i["properties"]["ADMIN"] in self.content["country_list"]:
-                init_slice.append(i)
-        self.nat_db = {"type": ["FeatureCollection"], "features": init_slice}
-
-        init_slice = []
-        for i in self.countries["features"]:
-            if i["properties"]["admin"] in self.content["country_list"]:
-                init_slice.append(i)
-        self.subnat_db = {"type": ["FeatureCollection"], "features": init_slice}
-
-        # Loads geojsons from the features directory
-        if self.config["irregular_feature_toggle"] == True:
-            self.features = []
-            files = os.listdir(Path(__file__).parent / "features")
-            for x in files:
-                if "feature_" in x:
-                    with open(
-                        Path(__file__).parent / f"features/{x}", "r", encoding="utf-8"
-                    ) as geojson_file:
-                        self.features.append(json.load(geojson_file))
-
-        # Loads csv file(s) from csv directory
-        if self.config["chloro_toggle"] == True:
-            self.csvs = []
-            files = os.listdir(Path(__file__).parent / "csv")
-            for x in files:
-                if "csv_" in x:
-                    with open(
-                        Path(__file__).parent / f"csv/{x}", "r", encoding="utf-8-sig"
-                    ) as csv_file:
-                        self.csvs.append(pd.read_csv(csv_file, sep=","))
-            # Loads geojson file(s) from features directory
-            self.geojsons = []
-            geoj_path = Path(__file__).parent / "features"
-            files = os.listdir(geoj_path)
-            for x in files:
-                if "geojson_" in x:
-                    with open(
-                        geoj_path / "geojson_1.geojson", "r", encoding="utf-8"
-                    ) as geojson_file:
-                        self.geojsons.append(json.load(geojson_file))
-
-        # CITY DATA
-        def city_data_builder():
-            def _iso_code_grabber():
-                """Initializes necessary data for mapping of cities"""
-                # List of ISO codes to be used for mapping cities and notable locations (city_list)
-                self.iso_list = pd.read_csv(
-                    city_db_path / "cities.csv", encoding="utf-8"
+        with self._stage("load_geometry") as stage:
+            # Compiled binary store (see geostore.py); only the partitions for country_list are read
+            if self.data.store is not None:
+                self.extent = self.data.store.bounds("nat", self.content["country_list"])
+            # Fall back on parsing the full geojson if the store hasn't been compiled
+            else:
+                self.extent = features_bounds(
+                    [
+                        i
+                        for i in self.data.naturalearth("nat")["features"]
+                        if i["properties"]["ADMIN"] in self.content["country_list"]
+                    ]
                 )
-                self.iso_codes = []
-
-                # Get ISO codes if cities being displayed
-                if (
-                    self.config["city_toggle"] == True
-                    and self.config["nat_toggle"] == True
-                ):
-                    for column, row in self.iso_list.iterrows():
-                        if row["Name"] in self.content["country_list"]:
-                            self.iso_codes.append(row["Code"])
-
-            def _city_loader():
-                """Checks for local municipal geodata and if missing downloads it. Lean=True to save load times by only importing major settlements"""
-
-                def __city_db_formatter(input_csv):
-                    """Formats and loads municipal data as a full df. Returns feature class P (populated places)"""
-                    df = pd.read_csv(
-                        input_csv,
-                        encoding="utf-8",
-                        sep="\t",
-                        low_memory=False,
-                        names=columns,
-                    )
-                    df = df.drop(
-                        columns=[
-                            "geonameid",
-                            "elevation",
-                            "dem",
-                            "timezone",
-                            "modification date",
-                            "admin4 code",
-                        ]
-                    )
-                    return df.loc[df["feature class"] == "P"]
-
-                def __city_extractor(input_df):
-                    """Gets the specific cities required and saves them to the class method"""
-                    city_list = [x[0] for x in self.content["city_list"]]
-                    input_df = input_df[input_df["asciiname"].isin(city_list)]
-                    return input_df
-
-                columns = [
-                    "geonameid",
-                    "name",
-                    "asciiname",
-                    "alternatenames",
-                    "latitude",
-                    "longitude",
-                    "feature class",
-                    "feature code",
-                    "country code",
-                    "cc2",
-                    "admin1 code",
-                    "admin2 code",
-                    "admin3 code",
-                    "admin4 code",
-                    "population",
-                    "elevation",
-                    "dem",
-                    "timezone",
-                    "modification date",
-                ]
 
-                out_df = pd.DataFrame(columns=columns).drop(
-                    columns=[
-                        "geonameid",
-                        "elevation",
-                        "dem",
-                        "timezone",
-                        "modification date",
-                        "admin4 code",
-                    ]
+            # Map zoom (fitted to the extent of country_list if not set) and the level of detail it calls for
+            if self.config["zoom"] is not None or self.extent is None:
+                self.zoom = self.config["zoom"] if self.config["zoom"] is not None else 4.12
+            else:
+                self.zoom = zoom_for_extent(self.extent)
+            self.tier = 0
+            if self.config["lod_toggle"] == True:
+                center_lat = (
+                    (self.extent[1] + self.extent[3]) / 2 if self.extent is not None else 0
                 )
+                self.tier = pick_tier(self.zoom, center_lat)
+
+            # Name/ISO keyed indexes over the loaded slices; positions in nat_db / subnat_db["features"]
+            self.nat_db = self._load_layer("nat")
+            self.nat_index = build_index(self.nat_db["features"], INDEX_KEYS["nat"])
+            stage["features"] = len(self.nat_db["features"])
+            # Subnational regions are only loaded once something draws them (see _load_subnats)
+            self.subnat_db = None
+            self.subnat_index = None
 
-                for i in range(0, len(self.iso_codes)):
-                    fname = str(self.iso_codes[i]) + ".zip"
-                    save_dir = city_db_path / self.iso_codes[i]
-                    full_path = save_dir / fname
-                    # Check for pre-existing dictionary
-                    if exists(save_dir):
-                        pass
-                    # Download data if not found
-                    else:
-                        download_url = (
-                            "https://download.geonames.org/export/dump/"
-                            + str(self.iso_codes[i])
-                            + ".zip"
+        # Loads custom features from the features directory, streamed (see feature_io.py) at the borders' level of detail
+        if self.config["irregular_feature_toggle"] == True:
+            with self._stage("load_features") as stage:
+                # Optionally only the features overlapping the countries being drawn
+                bounds = (
+                    self.extent if self.config["feature_extent_toggle"] == True else None
+                )
+                tolerance = TIER_TOLERANCES[self.tier]
+                paths = self.data.feature_paths()
+                if self.config["border_layer_toggle"] == True:
+                    # Mapbox layers take geojson
+                    self.features = [
+                        self.data.features(x, bounds, tolerance) for x in paths
+                    ]
+                    stage["features"] = sum(len(x) for x in self.features)
+                else:
+                    feature_coords = [
+                        self.data.feature_coords(
+                            x, bounds, tolerance, self.config["interior_rings_toggle"]
                         )
-                        save_dir = city_db_path / self.iso_codes[i]
-                        os.mkdir(city_db_path / self.iso_codes[i])
-
-                        # Download the zip
-                        r = requests.get(download_url, stream=True)
-                        with open(full_path, "wb") as file:
-                            for chunk in r.iter_content(chunk_size=128):
-                                file.write(chunk)
-
-                        # Extract the zip
-                        with ZipFile(save_dir / fname, "r") as zf:
-                            zf.extractall(save_dir)
-                        os.remove(save_dir / fname)
-
-                    # Extract and instantiate specific city data in content settings
-                    c_fname = str(self.iso_codes[i]) + ".txt"
-                    entry = __city_extractor(__city_db_formatter(save_dir / c_fname))
-                    if entry.shape[0] > 0:
-                        out_df = pd.concat([out_df, entry], axis=0)
-                    else:
-                        pass
+                        for x in paths
+                    ]
+                    self.feature_coords = [x[0] for x in feature_coords]
+                    stage["features"] = sum(x[1] for x in feature_coords)
 
-                return out_df
+        # Aggregates the csv file(s) in the csv directory per region (read in chunks; see choropleth.py)
+        if self.config["chloro_toggle"] == True:
+            with self._stage("chloro_ingest") as stage:
+                self.chloro_values = self.data.chloro_values(
+                    self.config["chloro_key"],
+                    self.config["chloro_value"],
+                    self.config["chloro_agg"],
+                    self.config["chloro_time"],
+                    self.config["chloro_period"],
+                )
+                stage["rows"] = len(self.chloro_values)
+
+        # CITY DATA (the ISO table and places caches are only read if there are cities to place)
+        if self.config["city_toggle"] == True and len(self.content["city_list"]) > 0:
+            with self._stage("city_ingest") as stage:
+                self._ingest_cities()
+                stage["rows"] = len(self.city_db)
 
-            # Initialize city data
-            _iso_code_grabber()
-            self.city_db = (
-                _city_loader()
-            )  # This will be setting the class-instantiated city db (for later plotting)
-
-        # Initialize relevant functions
-        if self.config["city_toggle"] == True:
-            city_data_builder()
-
-    def draw_map(self, in_df=None, in_geo=None):
-        """Main function to output final map"""
-
-        def _lat_cruncher(input: json):
-            """Converts geojson to list of lon/lat"""
-            points = []
-            out_list = []
-            for feature in input["features"]:
-                if feature["geometry"]["type"] == "Polygon":
-                    points.extend(feature["geometry"]["coordinates"][0])
-                    points.append([None, None])  # Marks the end of a polygon
-                elif feature["geometry"]["type"] == "MultiPolygon":
-                    for polyg in feature["geometry"]["coordinates"]:
-                        points.extend(polyg[0])
-                        points.append([None, None])  # End of polygon
-                elif feature["geometry"]["type"] == "MultiLineString":
-                    points.extend(feature["geometry"]["coordinates"])
-                    points.append([None, None])
-                elif feature["geometry"]["type"] == "LineString":
-                    points.extend(feature["geometry"]["coordinates"])
-                    points.append([None, None])
+        if self.report is not None:
+            self.report["seconds"] += time.perf_counter() - t_init
+        self._profile(False)
+
+    def _ingest_cities(self):
+        """Resolves the countries of country_list to ISO codes and reads the places of city_list from their GeoNames caches (self.city_db)"""
+        import pandas as pd
+
+        def _iso_code_grabber():
+            """Initializes necessary data for mapping of cities"""
+            # List of ISO codes to be used for mapping cities and notable locations (city_list)
+            self.iso_list = self.data.iso_list()
+            self.iso_codes = []
+
+            # Get ISO codes if cities being displayed
+            if (
+                self.config["city_toggle"] == True
+                and self.config["nat_toggle"] == True
+            ):
+                for column, row in self.iso_list.iterrows():
+                    if row["Name"] in self.content["country_list"]:
+                        self.iso_codes.append(row["Code"])
+
+        def _city_loader():
+            """Checks for local municipal geodata and if missing downloads it; populated places are read from a columnar cache"""
+
+            def __city_extractor(places):
+                """Gets the specific cities required from a country's places cache"""
+                city_list = [x[0] for x in self.content["city_list"]]
+                return select_places(places, city_list)
+
+            out_df = pd.DataFrame(columns=CACHE_COLUMNS)
+
+            # Download any missing country dumps (concurrently; see geonames.py)
+            self.data.fetch_places(self.iso_codes, self.config["geonames_mirror"])
+
+            for i in range(0, len(self.iso_codes)):
+                # Extract and instantiate specific city data in content settings; the dump is only parsed on first use (see geonames.py)
+                entry = __city_extractor(self.data.places(self.iso_codes[i]))
+                if entry.shape[0] > 0:
+                    out_df = pd.concat([out_df, entry], axis=0)
                 else:
                     pass
-            lons, lats = zip(*points)
-            out_list = [lons, lats]
-            return out_list
-
-        def _get_geodata(input_json: json):
-            """Get center position in a given feature (generally a country) for label placement; coordinate stored in-class"""
-            gpd_df = gpd.GeoDataFrame.from_features(input_json["features"])
-            area = float(gpd_df.area)
-            points = gpd_df.centroid
-            lon = float(points.x)
-            lat = float(points.y)
-            points = [lon, lat]
-            return points, area
+
+            return out_df
+
+        # Initialize city data
+        _iso_code_grabber()
+        self.city_db = (
+            _city_loader()
+        )  # This will be setting the class-instantiated city db (for later plotting)
+
+    @contextmanager
+    def _stage(self, name: str):
+        """Adds the wall time of the enclosed block to self.stage_times[name]; stages may nest (label_adjust is part of draw_labels)
+
+        Yields a dict the stage can put counts in (features, rows, labels). With instrument_toggle on, the stage is also
+        recorded in self.report with its peak memory and the traces/vertices it added to the figure.
+        """
+        info = {}
+        fig = getattr(self, "fig", None)
+        traces = len(fig.data) if fig is not None else 0
+        if self.report is not None:
+            record = {
+                "stage": name,
+                "parent": self._stage_stack[-1]["stage"] if len(self._stage_stack) > 0 else None,
+            }
+            self.report["stages"].append(record)
+            # tracemalloc has a single peak; hand the peak so far to the enclosing stage before resetting it
+            if len(self._stage_stack) > 0:
+                self._stage_stack[-1]["peak"] = max(
+                    self._stage_stack[-1]["peak"], tracemalloc.get_traced_memory()[1]
+                )
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+            self._stage_stack.append({"stage": name, "peak": 0})
+        t = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - t
+            self.stage_times[name] = self.stage_times.get(name, 0) + seconds
+
+            if self.report is not None:
+                peak = max(
+                    self._stage_stack.pop()["peak"], tracemalloc.get_traced_memory()[1]
+                )
+                if len(self._stage_stack) > 0:
+                    self._stage_stack[-1]["peak"] = max(
+                        self._stage_stack[-1]["peak"], peak
+                    )
+                tracemalloc.reset_peak()
+                new_traces = fig.data[traces:] if fig is not None else []
+                record.update(
+                    seconds=seconds,
+                    peak_memory=peak - start_memory,
+                    traces_added=len(new_traces),
+                    vertices=sum(
+                        len(x.lat) for x in new_traces if getattr(x, "lat", None) is not None
+                    ),
+                    **info,
+                )
+
+    def _load_layer(self, layer: str):
+        """Features of country_list in a NaturalEarth layer ("nat" or "subnat") at the map's level of detail"""
+        if self.data.store is not None:
+            features = self.data.store.features(
+                layer, self.content["country_list"], self.tier
+            )
+        else:
+            # Store a collection of the specific geojson data we're using so as to avoid re-iterating the NaturalEarth set.
+            # Shallow copies: the NaturalEarth features are shared by every builder (and thread) on this MapData, so only the copies are annotated
+            key = LAYERS[layer][1]
+            features = [
+                dict(i)
+                for i in self.data.naturalearth(layer)["features"]
+                if i["properties"][key] in self.content["country_list"]
+            ]
+            # Label anchors/areas from the full-resolution geometry, in one vectorized pass
+            feature_anchors(features)
+            features = simplify_features(features, TIER_TOLERANCES[self.tier])
+        return {"type": ["FeatureCollection"], "features": features}
+
+    def _load_subnats(self):
+        """Loads the subnational regions of country_list and their index on first use"""
+        if self.subnat_db is None:
+            self.subnat_db = self._load_layer("subnat")
+            self.subnat_index = build_index(
+                self.subnat_db["features"], INDEX_KEYS["subnat"]
+            )
+
+    def _select_subnats(self):
+        """Subnational regions to draw: those in subnat_list (by name, or whole countries) or else all of country_list's; each once, in order"""
+        names = self.content["subnat_list"]
+        if len(names) > 0 and self.subnat_db is None and self.data.store is not None:
+            # Only the named regions are read, found through the store's persistent index
+            offsets = dict.fromkeys(
+                no
+                for x in names
+                for no in self.data.store.lookup(
+                    "subnat", x, ["name", "admin"], self.content["country_list"]
+                )
+            )
+            return self.data.store.features_at("subnat", list(offsets), self.tier)
+
+        self._load_subnats()
+        if len(names) > 0:
+            matches = [
+                self.subnat_index[key].get(x, []) for x in names for key in ["name", "admin"]
+            ]
+        else:
+            matches = [
+                self.subnat_index["admin"].get(x, []) for x in self.content["country_list"]
+            ]
+        # Avoid double-counting when multiple countries in country_list
+        positions = dict.fromkeys(no for match in matches for no in match)
+        return [self.subnat_db["features"][no] for no in positions]
+
+    def draw_map(self, in_df=None, in_geo=None, groups: set = None):
+        """Main function to output final map; given groups (see DRAW_GROUPS), only those are redrawn into the last drawn figure
+
+        With chloro_toggle on, in_df (values per region id, a Series or single-column DataFrame) replaces the csv aggregates;
+        in_geo (a geojson FeatureCollection, matched on its chloro_key property) replaces the nat/subnat regions.
+        """
+        import pandas as pd
+        import plotly.graph_objects as go
+
+        self._profile(True)
+        t_draw = time.perf_counter()
+
+        def _label_adjuster(labels):
+            """Applies the shifts and size multipliers in self.content['label_adjusts'] to the label records before they are drawn; repeated adjustments accumulate"""
+
+            def __shifter(in_lon, in_lat, direction, degree):
+                """Adjusts lon, lat pairs for labels based on direction and degree"""
+
+                diagonals = degree / 2
+
+                if direction == "top":
+                    in_lat += degree
+                elif direction == "top left":
+                    in_lat += diagonals
+                    in_lon -= diagonals
+                elif direction == "top right":
+                    in_lat += diagonals
+                    in_lon += diagonals
+                elif direction == "bottom":
+                    in_lat -= degree
+                elif direction == "bottom left":
+                    in_lat -= diagonals
+                    in_lon -= diagonals
+                elif direction == "bottom right":
+                    in_lat -= diagonals
+                    in_lon += diagonals
+                elif direction == "right":
+                    in_lon += degree
+                elif direction == "left":
+                    in_lon -= degree
+                return in_lon, in_lat
+
+            adjusts = [y for y in self.content["label_adjusts"] if len(y) > 0]
+            if len(adjusts) == 0:
+                return labels
+
+            # Name-keyed index to label rows (a name can label several regions)
+            rows = {}
+            for no, text in enumerate(labels["text"]):
+                rows.setdefault(text, []).append(no)
+
+            lons = np.array([x[0] for x in labels["centroid"]], dtype="float64")
+            lats = np.array([x[1] for x in labels["centroid"]], dtype="float64")
+            scales = np.ones(labels.shape[0])
+            for y in adjusts:
+                matches = rows.get(y[0].upper().replace("_", " "), [])
+                if len(matches) == 0:
+                    continue
+                shift_lon, shift_lat = __shifter(0, 0, y[1], y[2])
+                lons[matches] += shift_lon
+                lats[matches] += shift_lat
+                if y[3] != 0:
+                    scales[matches] *= y[3]
+
+            labels["centroid"] = [[x, y] for x, y in zip(lons.tolist(), lats.tolist())]
+            labels["font_size"] = labels["font_size"] * scales
+            return labels
+
+        def _layer_geometry(name, features):
+            """Geometry of a dataset merged into one MultiPolygon ("polygons") and one MultiLineString ("lines"), whichever it has; rebuilt only when the dataset is reloaded"""
+            if name not in self.layer_geometry or self.layer_geometry[name][0] is not features:
+                # No per-feature properties are needed to draw
+                polygons = []
+                lines = []
+                for x in features:
+                    if x["geometry"] is None:
+                        continue
+                    elif x["geometry"]["type"] == "Polygon":
+                        polygons.append(x["geometry"]["coordinates"])
+                    elif x["geometry"]["type"] == "MultiPolygon":
+                        polygons.extend(x["geometry"]["coordinates"])
+                    elif x["geometry"]["type"] == "LineString":
+                        lines.append(x["geometry"]["coordinates"])
+                    elif x["geometry"]["type"] == "MultiLineString":
+                        lines.extend(x["geometry"]["coordinates"])
+                geometry = {}
+                if len(polygons) > 0:
+                    geometry["polygons"] = {"type": "MultiPolygon", "coordinates": polygons}
+                if len(lines) > 0:
+                    geometry["lines"] = {"type": "MultiLineString", "coordinates": lines}
+                self.layer_geometry[name] = (features, geometry)
+            return self.layer_geometry[name][1]
+
+        def _outline_on_fill(width):
+            """Layer mode: whether a fill layer draws the outline of its polygons itself (mapbox fill outlines are 1px) rather than a line layer repeating the geometry
+
+            Not under the chloro map or density cells, which would paint over an outline drawn beneath the traces
+            """
+            return (
+                float(width) <= 1
+                and self.config["chloro_toggle"] == False
+                and not any(
+                    x.get("mode") in ["grid", "hexbin"]
+                    for x in self.content.get("point_layers", [])
+                )
+            )
+
+        def _add_layer(geometries, kind, color, opacity, width=None, outline=None):
+            """Adds geometries (see _layer_geometry) as a mapbox fill/line layer beneath the traces (line layers are raised above filled traces, see below); given an outline color, a fill layer also outlines its polygons"""
+            geometries = [x for x in geometries if x is not None]
+            if len(geometries) == 0:
+                return
+            layer = dict(
+                sourcetype="geojson",
+                source={
+                    "type": "FeatureCollection",
+                    "features": [
+                        {"type": "Feature", "properties": {}, "geometry": x} for x in geometries
+                    ],
+                },
+                type=kind,
+                color=color,
+                opacity=opacity,
+                below="traces",
+            )
+            if kind == "line":
+                layer["line"] = dict(width=width)
+            elif outline is not None:
+                layer["fill"] = dict(outlinecolor=outline)
+            layers.append(layer)
 
         def _draw_labels():
+            """Draws nat/subnat labels; one text trace per label type and font size"""
 
-            # Clean up label df
-            self.label_df.index = self.label_df["name"]
-            self.label_df.drop(columns=["name"], inplace=True)
+            # Clean up label df (once; labels are redrawn from it by update)
+            if "name" in self.label_df.columns:
+                self.label_df.index = self.label_df["name"]
+                self.label_df.drop(columns=["name"], inplace=True)
 
+            labels = []
             if self.config["nat_label_toggle"] == True:
-                for index, row in self.label_df.iterrows():
-                    if row["type"] == "nat":
-                        fig.add_scattermapbox(
-                            lat=[row["centroid"][1]],
-                            lon=[row["centroid"][0]],
-                            showlegend=False,
-                            mode="text",
-                            text=index.upper(),
-                            fillcolor=self.styling["nat_label_color"],
-                            opacity=self.styling["nat_label_opacity"],
-                            textposition="middle center",
-                            # Adjusts nat labels on the basis of country size
-                            textfont=dict(
-                                size=self.styling["nat_label_size"] * 1.5
-                                if row["size"] > 150
-                                else self.styling["nat_label_size"]
-                                if row["size"] > 110
-                                else (self.styling["nat_label_size"] * 0.8)
-                                if row["size"] > 80
-                                else (self.styling["nat_label_size"] * 0.65)
-                                if row["size"] > 50
-                                else (self.styling["nat_label_size"] * 0.45)
-                                if row["size"] > 30
-                                else (self.styling["nat_label_size"] * 0.35)
-                                if row["size"] > 10
-                                else 10,
-                                color=self.styling["nat_label_color"],
-                            ),
-                        ),
-            else:
-                pass
+                labels.append(self.label_df.loc[self.label_df["type"] == "nat"])
+
+            if self.config["subnat_label_toggle"] == True:
+                subnat_labels = self.label_df.loc[self.label_df["type"] == "subnat"]
+                # Only the subnats requested by name are labelled (not whole countries in subnat_list)
+                if len(self.content["subnat_list"]) > 0:
+                    wanted = [
+                        x
+                        for x in self.content["subnat_list"]
+                        if x not in self.content["country_list"]
+                    ]
+                    subnat_labels = subnat_labels.loc[subnat_labels.index.isin(wanted)]
+                labels.append(subnat_labels)
 
-            # Adjusts subnat labels on the basis of size
-            if (
-                self.config["subnat_label_toggle"] == True
-                and len(self.content["subnat_list"]) > 0
-            ):
-                for x in self.content["subnat_list"]:
-                    if x not in self.content["country_list"]:
-
-                        fig.add_scattermapbox(
-                            lat=[self.label_df.loc[x]["centroid"][1]],
-                            lon=[self.label_df.loc[x]["centroid"][0]],
-                            showlegend=False,
-                            mode="text",
-                            text=x.upper(),
-                            fillcolor=self.styling["subnat_label_color"],
-                            opacity=self.styling["subnat_label_opacity"],
-                            textposition="middle center",
-                            # Adjusts on the basis of country size
-                            textfont=dict(
-                                size=self.styling["subnat_label_size"] * 1.5
-                                if self.label_df.loc[x]["size"] > 150
-                                else self.styling["subnat_label_size"]
-                                if self.label_df.loc[x]["size"] > 110
-                                else (self.styling["subnat_label_size"] * 0.9)
-                                if self.label_df.loc[x]["size"] > 80
-                                else (self.styling["subnat_label_size"] * 0.80)
-                                if self.label_df.loc[x]["size"] > 50
-                                else (self.styling["subnat_label_size"] * 0.60)
-                                if self.label_df.loc[x]["size"] > 30
-                                else (self.styling["subnat_label_size"] * 0.50)
-                                if self.label_df.loc[x]["size"] > 10
-                                else 10,
-                                color=self.styling["subnat_label_color"],
-                            ),
-                        ),
+            if len(labels) == 0:
+                return
+            labels = pd.concat(labels, axis=0)
 
-            if (
-                self.config["subnat_label_toggle"] == True
-                and len(self.content["subnat_list"]) == 0
+            # Adjusts label size on the basis of country/region size: bin the areas once, then scale the styled size
+            bins = np.searchsorted(
+                LABEL_SIZE_BINS, labels["size"].to_numpy(dtype="float64"), side="left"
+            )
+            for label_type in ["nat", "subnat"]:
+                mask = (labels["type"] == label_type).to_numpy()
+                scales = np.asarray([0] + LABEL_SIZE_SCALES[label_type])[bins[mask]]
+                labels.loc[mask, "font_size"] = np.where(
+                    bins[mask] == 0,
+                    10,
+                    self.styling[f"{label_type}_label_size"] * scales,
+                )
+
+            labels["text"] = [x.upper() for x in labels.index]
+            with self._stage("label_adjust"):
+                labels = _label_adjuster(labels)
+
+            # Scattermapbox only takes a single font size per trace; group by type and size
+            for (label_type, font_size), rows in labels.groupby(
+                ["type", "font_size"], sort=False
             ):
-                for index, row in self.label_df.iterrows():
-                    if row["type"] == "subnat":
-                        fig.add_scattermapbox(
-                            lat=[row["centroid"][1]],
-                            lon=[row["centroid"][0]],
-                            showlegend=False,
-                            mode="text",
-                            text=index.upper(),
-                            fillcolor=self.styling["subnat_label_color"],
-                            opacity=self.styling["subnat_label_opacity"],
-                            textposition="middle center",
-                            # Adjusts on the basis of country size
-                            textfont=dict(
-                                size=self.styling["subnat_label_size"] * 1.5
-                                if row["size"] > 150
-                                else self.styling["subnat_label_size"]
-                                if row["size"] > 110
-                                else (self.styling["subnat_label_size"] * 0.9)
-                                if row["size"] > 80
-                                else (self.styling["subnat_label_size"] * 0.80)
-                                if row["size"] > 50
-                                else (self.styling["subnat_label_size"] * 0.60)
-                                if row["size"] > 30
-                                else (self.styling["subnat_label_size"] * 0.50)
-                                if row["size"] > 10
-                                else 10,
-                                color=self.styling["subnat_label_color"],
-                            ),
-                        ),
+                fig.add_scattermapbox(
+                    lat=[x[1] for x in rows["centroid"]],
+                    lon=[x[0] for x in rows["centroid"]],
+                    showlegend=False,
+                    mode="text",
+                    text=rows["text"].tolist(),
+                    fillcolor=self.styling[f"{label_type}_label_color"],
+                    opacity=self.styling[f"{label_type}_label_opacity"],
+                    textposition="middle center",
+                    textfont=dict(
+                        size=font_size,
+                        color=self.styling[f"{label_type}_label_color"],
+                    ),
+                )
 
         def _draw_countries(outline=False):
             """Draws external (national) borders."""
@@ -437,47 +828,66 @@ class MapBuilder:
                 """Crunch the data for countries to be drawn; derives lon/lat pairs from geojson"""
                 countries_slice = []
                 labels_slice = []
-                exclusion_list = []
-                for i in self.nat_db["features"]:
-                    # Outputs the lon/lat pairs for countries in the country_list and also stores their centroid point in-class for future reference
-
-                    if (
-                        i["properties"]["ADMIN"] in self.content["country_list"]
-                        and i["properties"]["ADMIN"] not in exclusion_list
-                    ):
+                # Outputs the lon/lat pairs for countries in the country_list and also stores their centroid point in-class for future reference
+                # (dict.fromkeys avoids double-counting when a country is repeated in country_list)
+                for country in dict.fromkeys(self.content["country_list"]):
+                    for no in self.nat_index["ADMIN"].get(country, []):
+                        i = self.nat_db["features"][no]
                         i["id"] = i["properties"]["ADMIN"]
                         countries_slice.append(i)
 
-                        # Store centroids in class df for labels
-                        points, area = _get_geodata(
-                            {"type": ["FeatureCollection"], "features": [i]}
-                        )
+                        # Store label anchors in class df; anchor and area are precomputed (see geostore.feature_anchors)
                         new_entry = {
                             "name": str(i["properties"]["ADMIN"]),
-                            "centroid": points,
-                            "size": area,
+                            "centroid": i["anchor"],
+                            "size": i["area"],
                             "position": "middle-right",
                             "type": "nat",
                         }
 
                         labels_slice.append(new_entry)
 
-                        # Avoid double-counting when multiple countries in country_list
-                        exclusion_list.append(i["properties"]["ADMIN"])
-
                 self.label_df = pd.concat(
                     [self.label_df, pd.DataFrame(labels_slice)],
                     ignore_index=True,
                     axis=0,
                 )
 
-                # Return a json containing geometry of specified countries
-                return _lat_cruncher(
-                    {"type": "FeatureCollection", "features": countries_slice}
-                )
+                # Return the geojson features of specified countries
+                return countries_slice
+
+            # Layer mode: with nothing drawn between the countries' fill and their outline, the fill layer draws both
+            outline_on_fill = (
+                self.config["subnat_toggle"] == False
+                and len(self.content["subnat_list"]) == 0
+                and self.config["irregular_feature_toggle"] == False
+                and _outline_on_fill(self.styling["nat_border_width"])
+            )
 
             if outline == False:
-                self.external_borders = __crunch_countries()
+                if self.nat_features is None:
+                    with self._stage("crunch_countries") as stage:
+                        self.nat_features = __crunch_countries()
+                        stage["features"] = len(self.nat_features)
+
+                if self.config["border_layer_toggle"] == True:
+                    if (
+                        self.config["chloro_toggle"] == False
+                        and self.config["subnat_toggle"] == False
+                    ):
+                        _add_layer(
+                            [_layer_geometry("nat", self.nat_features).get("polygons")],
+                            "fill",
+                            self.styling["background_color"],
+                            self.styling["nat_border_opacity"],
+                            outline=self.styling["nat_border_color"] if outline_on_fill else None,
+                        )
+                    return
+
+                if self.external_borders is None:
+                    self.external_borders = build_coords(
+                        self.nat_features, holes=self.config["interior_rings_toggle"]
+                    )
 
                 # Add external borders to overall figure
                 fig.add_scattermapbox(
@@ -498,6 +908,18 @@ class MapBuilder:
                 )
 
             if outline == True:
+                # As a layer, the outline is only drawn once: on top, by _draw_irregulars() if there are custom features
+                if self.config["border_layer_toggle"] == True:
+                    if self.config["irregular_feature_toggle"] == False and not outline_on_fill:
+                        _add_layer(
+                            list(_layer_geometry("nat", self.nat_features).values()),
+                            "line",
+                            self.styling["nat_border_color"],
+                            self.styling["nat_border_opacity"],
+                            width=self.styling["nat_border_width"],
+                        )
+                    return
+
                 # Add external borders to overall figure
                 fig.add_scattermapbox(
                     lat=self.external_borders[1],
@@ -516,62 +938,26 @@ class MapBuilder:
         def _draw_subnats():
             """Draws sub-national (regional/provincial/state) borders"""
 
-            def __crunch_subnats():
+            def __crunch_subnats(features):
                 """Crunch the data for countries to be drawn; derives lon/lat pairs from geojson"""
                 subnats_slice = []
-                exclusion_list = []
                 labels_slice = []
-                for i in self.subnat_db["features"]:
-                    if len(self.content["subnat_list"]) > 0:
-                        if (
-                            i["properties"]["name"] in self.content["subnat_list"]
-                            or i["properties"]["admin"] in self.content["subnat_list"]
-                        ) and i["properties"]["name"] not in exclusion_list:
-                            i["id"] = i["properties"]["admin"]
-                            subnats_slice.append(i)
-
-                            # Store centroids in class df for labels
-                            points, area = _get_geodata(
-                                {"type": ["FeatureCollection"], "features": [i]}
-                            )
-
-                            new_entry = {
-                                "name": i["properties"]["name_en"],
-                                "centroid": points,
-                                "size": area,
-                                "position": "middle-right",
-                                "code": i["properties"]["iso_3166_2"].replace("-", ""),
-                                "type": "subnat",
-                            }
-
-                            labels_slice.append(new_entry)
-                    else:
-                        if (
-                            i["properties"]["admin"] in self.content["country_list"]
-                            and i["properties"]["name"] not in exclusion_list
-                        ):
-                            i["id"] = i["properties"]["admin"]
-
-                            subnats_slice.append(i)
-
-                            # Store centroids in class df for labels
-                            points, area = _get_geodata(
-                                {"type": ["FeatureCollection"], "features": [i]}
-                            )
-
-                            new_entry = {
-                                "name": i["properties"]["name_en"],
-                                "centroid": points,
-                                "size": area,
-                                "position": "middle-right",
-                                "code": i["properties"]["iso_3166_2"].replace("-", ""),
-                                "type": "subnat",
-                            }
-
-                            labels_slice.append(new_entry)
-
-                    # Avoid double-counting when multiple countries in country_list
-                    exclusion_list.append(i["properties"]["name"])
+
+                for i in features:
+                    i["id"] = i["properties"]["admin"]
+                    subnats_slice.append(i)
+
+                    # Store label anchors in class df; anchor and area are precomputed (see geostore.feature_anchors)
+                    new_entry = {
+                        "name": i["properties"]["name_en"],
+                        "centroid": i["anchor"],
+                        "size": i["area"],
+                        "position": "middle-right",
+                        "code": i["properties"]["iso_3166_2"].replace("-", ""),
+                        "type": "subnat",
+                    }
+
+                    labels_slice.append(new_entry)
 
                 self.label_df = pd.concat(
                     [self.label_df, pd.DataFrame(labels_slice)],
@@ -579,10 +965,8 @@ class MapBuilder:
                     axis=0,
                 )
 
-                # Return a json containing geometry of specified countries
-                return _lat_cruncher(
-                    {"type": "FeatureCollection", "features": subnats_slice}
-                )
+                # Return the geojson features of specified subnats
+                return subnats_slice
 
             # Checks toggles and draws subnats
             if (
@@ -590,12 +974,44 @@ class MapBuilder:
                 or len(self.content["subnat_list"]) > 0
             ):
 
-                internal_borders = __crunch_subnats()
+                if self.subnat_features is None:
+                    with self._stage("load_subnats") as stage:
+                        features = self._select_subnats()
+                        stage["features"] = len(features)
+                    with self._stage("crunch_subnats") as stage:
+                        self.subnat_features = __crunch_subnats(features)
+                        stage["features"] = len(self.subnat_features)
+                subnat_features = self.subnat_features
+
+                if self.config["border_layer_toggle"] == True:
+                    subnat = _layer_geometry("subnat", subnat_features)
+                    outline_on_fill = _outline_on_fill(self.styling["subnat_border_width"])
+                    if self.config["chloro_toggle"] == False:
+                        _add_layer(
+                            [subnat.get("polygons")],
+                            "fill",
+                            self.styling["background_color"],
+                            self.styling["subnat_border_opacity"],
+                            outline=self.styling["subnat_border_color"] if outline_on_fill else None,
+                        )
+                    _add_layer(
+                        [subnat.get("lines")] if outline_on_fill else list(subnat.values()),
+                        "line",
+                        self.styling["subnat_border_color"],
+                        self.styling["subnat_border_opacity"],
+                        width=self.styling["subnat_border_width"],
+                    )
+                    return
+
+                if self.internal_borders is None:
+                    self.internal_borders = build_coords(
+                        subnat_features, holes=self.config["interior_rings_toggle"]
+                    )
 
                 # Add internal borders to figure
                 fig.add_scattermapbox(
-                    lat=internal_borders[1],
-                    lon=internal_borders[0],
+                    lat=self.internal_borders[1],
+                    lon=self.internal_borders[0],
                     showlegend=False,
                     mode="lines",
                     fillcolor=self.styling["background_color"],
@@ -614,178 +1030,47 @@ class MapBuilder:
             """Draws cities and other notable features"""
 
             def __crunch_markers():
-                """Crunch the data for cities to be drawn; derives lon/lat pairs from custom db initialized at class init (self.city_db)"""
+                """Crunch the data for cities to be drawn; resolves all of city_list against the custom db initialized at class init (self.city_db) in one pass"""
                 out_df = pd.DataFrame(
                     columns=["name", "type", "lon", "lat", "position"]
                 )
-                cities_slice = []
-
-                for x in self.content["city_list"]:
-                    # The city DB contains a variety of feature codes based on size of a population center. This goes for the largest one by moving down the hierarchy
-
-                    if any(
-                        self.city_db.loc[self.city_db["name"] == x[0]]["feature code"]
-                        == "PPLC"
-                    ):
-                        cities_slice.append(
-                            {
-                                "name": x[0],
-                                "type": "city",
-                                "lon": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLC")
-                                    ]["longitude"]
-                                ),
-                                "lat": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLC")
-                                    ]["latitude"]
-                                ),
-                                "position": x[1],
-                            }
-                        )
-                        continue
-
-                    if any(
-                        self.city_db.loc[self.city_db["name"] == x[0]]["feature code"]
-                        == "PPLA"
-                    ):
-                        cities_slice.append(
-                            {
-                                "name": x[0],
-                                "type": "city",
-                                "lon": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLA")
-                                    ]["longitude"]
-                                ),
-                                "lat": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLA")
-                                    ]["latitude"]
-                                ),
-                                "position": x[1],
-                            }
-                        )
-                        continue
+                if len(self.content["city_list"]) == 0:
+                    return out_df
 
-                    if any(
-                        self.city_db.loc[self.city_db["name"] == x[0]]["feature code"]
-                        == "PPLA2"
-                    ):
-                        cities_slice.append(
-                            {
-                                "name": x[0],
-                                "type": "city",
-                                "lon": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLA2")
-                                    ]["longitude"]
-                                ),
-                                "lat": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLA2")
-                                    ]["latitude"]
-                                ),
-                                "position": x[1],
-                            }
-                        )
-                        continue
-
-                    if any(
-                        self.city_db.loc[self.city_db["name"] == x[0]]["feature code"]
-                        == "PPLA3"
-                    ):
-                        cities_slice.append(
-                            {
-                                "name": x[0],
-                                "type": "city",
-                                "lon": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLA3")
-                                    ]["longitude"]
-                                ),
-                                "lat": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLA3")
-                                    ]["latitude"]
-                                ),
-                                "position": x[1],
-                            }
-                        )
-                        continue
+                requested = pd.DataFrame(
+                    [x[:2] for x in self.content["city_list"]], columns=["name", "position"]
+                )
+                requested["order"] = range(requested.shape[0])
 
-                    if any(
-                        self.city_db.loc[self.city_db["name"] == x[0]]["feature code"]
-                        == "PPLA4"
-                    ):
-                        cities_slice.append(
-                            {
-                                "name": x[0],
-                                "type": "city",
-                                "lon": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLA4")
-                                    ]["longitude"]
-                                ),
-                                "lat": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPLA4")
-                                    ]["latitude"]
-                                ),
-                                "position": x[1],
-                            }
-                        )
-                        continue
+                # The city DB contains a variety of feature codes based on size of a population center. This goes for the largest one by ranking the hierarchy
+                candidates = self.city_db.loc[
+                    self.city_db["name"].isin(requested["name"]),
+                    ["name", "feature code", "longitude", "latitude", "population"],
+                ]
+                candidates["rank"] = candidates["feature code"].map(FEATURE_CODE_RANKS)
+                candidates = (
+                    candidates.dropna(subset=["rank"])
+                    .sort_values(["rank", "population"], ascending=[True, False])
+                    .drop_duplicates(subset=["name"], keep="first")
+                )
 
-                    if any(
-                        self.city_db.loc[self.city_db["name"] == x[0]]["feature code"]
-                        == "PPL"
-                    ):
-                        cities_slice.append(
-                            {
-                                "name": x[0],
-                                "type": "city",
-                                "lon": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPL")
-                                    ]["longitude"]
-                                ),
-                                "lat": float(
-                                    self.city_db.loc[
-                                        (self.city_db["name"] == x[0])
-                                        & (self.city_db["feature code"] == "PPL")
-                                    ]["latitude"]
-                                ),
-                                "position": x[1],
-                            }
-                        )
-                        continue
+                cities = requested.merge(candidates, on="name", how="inner").sort_values(
+                    "order"
+                )
+                cities = cities.rename(columns={"longitude": "lon", "latitude": "lat"})
+                cities["type"] = "city"
 
                 out_df = pd.concat(
-                    [out_df, pd.DataFrame(cities_slice)], ignore_index=False, axis=0
+                    [out_df, cities[out_df.columns]], ignore_index=True, axis=0
                 )
 
                 return out_df
 
-            city_coords = __crunch_markers()
-
-            for index, row in city_coords.iterrows():
-
+            def __add_markers(lat, lon, text, position):
+                """Adds a marker trace (one or many points) using the city/marker styling"""
                 fig.add_scattermapbox(
-                    lat=[row["lat"]],
-                    lon=[row["lon"]],
+                    lat=lat,
+                    lon=lon,
                     showlegend=False,
                     mode="markers+text",
                     marker=go.scattermapbox.Marker(
@@ -794,8 +1079,8 @@ class MapBuilder:
                         allowoverlap=False,
                         color=self.styling["marker_color"],
                     ),
-                    textposition=row["position"],
-                    text=row["name"],
+                    textposition=position,
+                    text=text,
                     textfont=dict(
                         size=self.styling["city_text_size"],
                         color=self.styling["city_text_color"],
@@ -803,29 +1088,40 @@ class MapBuilder:
                     fillcolor=self.styling["background_color"],
                 )
 
+            with self._stage("crunch_markers") as stage:
+                city_coords = __crunch_markers()
+                stage["rows"] = len(city_coords)
+
+            # Irregular markers share the city styling, so they are batched together with the cities
+            if self.config["marker_batch_toggle"] == True:
+                markers = pd.concat(
+                    [
+                        city_coords,
+                        pd.DataFrame(
+                            self.content["irregular_markers"],
+                            columns=["name", "lon", "lat", "position"],
+                        ).assign(type="irregular"),
+                    ],
+                    ignore_index=True,
+                    axis=0,
+                )
+                # Scattermapbox only takes a single textposition per trace; one trace per label position
+                for position, group in markers.groupby("position", sort=False):
+                    __add_markers(
+                        group["lat"].tolist(),
+                        group["lon"].tolist(),
+                        group["name"].tolist(),
+                        position,
+                    )
+                return
+
+            for index, row in city_coords.iterrows():
+                __add_markers([row["lat"]], [row["lon"]], row["name"], row["position"])
+
             # Map irregular features if there are any
             if len(self.content["irregular_markers"]) > 0:
                 for x in self.content["irregular_markers"]:
-
-                    fig.add_scattermapbox(
-                        lat=[x["lat"]],
-                        lon=[x["lon"]],
-                        showlegend=False,
-                        mode="markers+text",
-                        marker=go.scattermapbox.Marker(
-                            size=self.styling["marker_size"],
-                            symbol="circle",
-                            allowoverlap=False,
-                            color=self.styling["marker_color"],
-                        ),
-                        textposition=x["position"],
-                        text=x["name"],
-                        textfont=dict(
-                            size=self.styling["city_text_size"],
-                            color=self.styling["city_text_color"],
-                        ),
-                        fillcolor=self.styling["background_color"],
-                    )
+                    __add_markers([x["lat"]], [x["lon"]], x["name"], x["position"])
 
             else:
                 pass
@@ -833,19 +1129,37 @@ class MapBuilder:
         def _draw_irregulars():
             """Draws irregular features (imported geojson files from the features sub-directory)"""
 
-            def __crunch_irregulars():
-                """Prepares geojson data; takes a class list of geojsons (self.features) and outputs list of lon/lat pairs"""
-                features_out = []
-                for geo in self.features:
-                    features_out.append(
-                        _lat_cruncher(
-                            {"type": "FeatureCollection", "features": geo["features"]}
-                        )
+            if self.config["border_layer_toggle"] == True:
+                outline_on_fill = _outline_on_fill(self.styling["feature_border_width"])
+                for i, features in enumerate(self.features):
+                    geometry = _layer_geometry(("features", i), features)
+                    _add_layer(
+                        [geometry.get("polygons")],
+                        "fill",
+                        self.styling["feature_color"],
+                        self.styling["feature_border_opacity"],
+                        outline=self.styling["feature_border_color"] if outline_on_fill else None,
+                    )
+                    _add_layer(
+                        [geometry.get("lines")] if outline_on_fill else list(geometry.values()),
+                        "line",
+                        self.styling["feature_border_color"],
+                        self.styling["feature_border_opacity"],
+                        width=self.styling["feature_border_width"],
                     )
-                return features_out
 
-            # Map irregulars (allows for multiple features
-            for x in __crunch_irregulars():
+                # Top layer of external borders, thickened to hide imperfections
+                _add_layer(
+                    list(_layer_geometry("nat", self.nat_features).values()),
+                    "line",
+                    self.styling["nat_border_color"],
+                    self.styling["nat_border_opacity"],
+                    width=self.styling["nat_border_width"] * 1.5,
+                )
+                return
+
+            # Map irregulars (allows for multiple features; coordinates were streamed into buffers at init)
+            for x in self.feature_coords:
                 fig.add_scattermapbox(
                     lat=x[1],
                     lon=x[0],
@@ -875,92 +1189,322 @@ class MapBuilder:
                 ),
             )
 
-        def _draw_chloro():
-            """Uses data from csv files located in csv directory to draw a chloro layer. Assumption that the csv file has the following headers: admin, admin1, date.  Code col is what to match, date col is date"""
-
-            working_geo = in_geo
-            working_df = in_df
-
-            trace = go.Figure(
-                go.Choroplethmapbox(
-                    geojson=in_geo,
-                    locations=in_df.index,
-                    z=in_df["mw"],
-                    colorscale="YlOrRd",
+        def _draw_points():
+            """Draws the point layers in content['point_layers'], aggregated at the map's zoom (see points.py); one trace per layer. Returns the number of input points"""
+            total = 0
+            for layer in self.content["point_layers"]:
+                mode = layer.get("mode", "scatter")
+                name = layer.get("name", Path(layer["path"]).stem)
+                with self._stage("load_points"):
+                    points = self.data.points(
+                        layer["path"],
+                        layer.get("lon", "lon"),
+                        layer.get("lat", "lat"),
+                        layer.get("weight"),
+                    )
+                total += len(points["lon"])
+                out = aggregate_points(
+                    points,
+                    mode,
+                    self.zoom,
+                    self.config["point_cell_size"],
+                    self.config["point_max_cells"],
+                    self.config["point_max_points"],
                 )
-            )
-
-            fig.add_traces(trace.data[0])
-
-        def _label_adjuster():
-            """As a final step, this function iterates over the fig object and adjusts labels specified in self.content['label_adjusts']"""
-
-            def __shifter(in_lon, in_lat, direction, degree):
-                """Adjusts lon, lat pairs for labels based on direction and degree"""
-
-                diagonals = degree / 2
-
-                if direction == "top":
-                    in_lat += degree
-                elif direction == "top left":
-                    in_lat += diagonals
-                    in_lon -= diagonals
-                elif direction == "top right":
-                    in_lat += diagonals
-                    in_lon += diagonals
-                elif direction == "bottom":
-                    in_lat -= degree
-                elif direction == "bottom left":
-                    in_lat -= diagonals
-                    in_lon -= diagonals
-                elif direction == "bottom right":
-                    in_lat -= diagonals
-                    in_lon += diagonals
-                elif direction == "right":
-                    in_lon += degree
-                elif direction == "left":
-                    in_lon -= degree
-                return in_lon, in_lat
 
-            if len(self.content["label_adjusts"]) > 1:
-                exclusion_list = []
-                for no, x in enumerate(fig.data):
-                    if x.mode == "text" and x.text not in exclusion_list:
-                        for y in self.content["label_adjusts"]:
-                            if y[0].upper().replace("_", " ") == x.text:
-                                adjusted_lon, adjusted_lat = __shifter(
-                                    fig.data[no].lon[0], fig.data[no].lat[0], y[1], y[2]
-                                )
-                                fig.data[no].lon = [adjusted_lon]
-                                fig.data[no].lat = [adjusted_lat]
-                                if y[3] != 0:
-                                    fig.data[no].textfont["size"] = (
-                                        fig.data[no].textfont["size"] * y[3]
-                                    )
-                                else:
-                                    pass
-                            else:
-                                pass
-
-                        exclusion_list.append(x.text)
+                if mode in ["grid", "hexbin"]:
+                    # Density cells as one choropleth trace
+                    fig.add_choroplethmapbox(
+                        geojson={
+                            "type": "FeatureCollection",
+                            "features": [
+                                {
+                                    "type": "Feature",
+                                    "id": str(no),
+                                    "properties": {},
+                                    "geometry": {"type": "Polygon", "coordinates": [cell.tolist()]},
+                                }
+                                for no, cell in enumerate(out["cells"])
+                            ],
+                        },
+                        locations=[str(no) for no in range(len(out["values"]))],
+                        z=out["values"],
+                        name=name,
+                        hovertemplate=f"%{{z}}<extra>{name}</extra>",
+                        colorscale=self.styling["point_colorscale"],
+                        showscale=self.config["chloro_toggle"] == False,
+                        colorbar=dict(title=name),
+                        marker=dict(opacity=self.styling["point_opacity"], line=dict(width=0)),
+                        showlegend=False,
+                    )
+                elif mode == "cluster":
+                    # Marker area grows with the log of the cluster size; single points stay unlabelled
+                    fig.add_scattermapbox(
+                        lat=out["lat"],
+                        lon=out["lon"],
+                        name=name,
+                        mode="markers+text",
+                        marker=dict(
+                            size=self.styling["point_size"] * (1 + 2 * np.log10(out["counts"])),
+                            color=self.styling["point_color"],
+                            opacity=self.styling["point_opacity"],
+                        ),
+                        text=[f"{x:,}" if x > 1 else "" for x in out["counts"]],
+                        textposition="middle center",
+                        textfont=dict(
+                            size=self.styling["point_size"] * 1.5,
+                            color=self.styling["city_text_color"],
+                        ),
+                        customdata=out["values"],
+                        hovertemplate=f"%{{customdata:,}}<extra>{name}</extra>",
+                        showlegend=False,
+                    )
+                else:
+                    fig.add_scattermapbox(
+                        lat=out["lat"],
+                        lon=out["lon"],
+                        name=name,
+                        mode="markers",
+                        marker=dict(
+                            size=self.styling["point_size"],
+                            color=self.styling["point_color"],
+                            opacity=self.styling["point_opacity"],
+                        ),
+                        hoverinfo="name",
+                        showlegend=False,
+                    )
+            return total
 
+        def _draw_chloro():
+            """Draws the chloro layer: per-region values (the aggregated csvs, or in_df) joined to the nat/subnat regions of country_list; only the matched features, at the map's level of detail, go into the trace"""
+            values = self.chloro_values if in_df is None else in_df
+            # Animated: a DataFrame of regions by frame (see choropleth.aggregate_csv); otherwise a single-column DataFrame is as good as a Series
+            animated = self.config["chloro_time"] is not None and isinstance(values, pd.DataFrame)
+            if isinstance(values, pd.DataFrame) and not animated:
+                values = values.iloc[:, 0]
+            if animated:
+                fig.frames = []
+                fig.layout.sliders = []
+                fig.layout.updatemenus = []
+                if values.shape[1] == 0:
+                    return 0
+
+            layer = self.config["chloro_layer"]
+            if in_geo is not None:
+                # Caller-supplied regions, matched on the chloro_key property
+                features = in_geo["features"]
+                keys = [self.config["chloro_key"]]
+                index = build_index(features, keys)
+                name_key = keys[0]
+            elif layer == "subnat":
+                self._load_subnats()
+                features, index = self.subnat_db["features"], self.subnat_index
+                keys, name_key = JOIN_KEYS[layer], NAME_KEYS[layer]
             else:
-                pass
+                features, index = self.nat_db["features"], self.nat_index
+                keys, name_key = JOIN_KEYS[layer], NAME_KEYS[layer]
+
+            positions, z = join_regions(values, index, keys)
+            keep = region_filter(
+                features,
+                positions,
+                self.content["csv_list"],
+                keys if in_geo is not None else INDEX_KEYS[layer],
+            )
+            positions, z = positions[keep], z[keep]
+            if len(positions) == 0:
+                return 0
+
+            # Geometry only; the trace refers to features by position. Frames reuse it and only carry their z
+            fig.add_choroplethmapbox(
+                geojson={
+                    "type": "FeatureCollection",
+                    "features": [
+                        {
+                            "type": "Feature",
+                            "id": str(no),
+                            "properties": {},
+                            "geometry": features[no]["geometry"],
+                        }
+                        for no in positions
+                    ],
+                },
+                locations=[str(no) for no in positions],
+                z=z[:, 0] if animated else z,
+                # One color scale for every frame
+                zmin=np.nanmin(z) if animated else None,
+                zmax=np.nanmax(z) if animated else None,
+                text=[str(features[no]["properties"].get(name_key, "")) for no in positions],
+                hovertemplate="%{text}: %{z}<extra></extra>",
+                colorscale=self.config["chloro_colorscale"],
+                colorbar=dict(title=self.config["chloro_value"] or "count"),
+                marker=dict(line=dict(width=0)),
+                showlegend=False,
+            )
+            if animated:
+                _animate(values.columns.astype(str).tolist(), z)
+            return len(positions)
+
+        def _animate(labels, z):
+            """Adds a frame per column of z (regions by frame) to the chloro trace, with a slider and play/pause buttons"""
+            duration = self.config["chloro_frame_duration"]
+            # The chloro trace is the first trace of the map (see DRAW_GROUPS)
+            fig.frames = [
+                go.Frame(
+                    name=label,
+                    data=[{"type": "choroplethmapbox", "z": z[:, no]}],
+                    traces=[0],
+                )
+                for no, label in enumerate(labels)
+            ]
+            # Mapbox traces can't transition; every frame is a redraw
+            play = dict(
+                frame=dict(duration=duration, redraw=True),
+                transition=dict(duration=0),
+                fromcurrent=True,
+                mode="immediate",
+            )
+            fig.layout.sliders = [
+                dict(
+                    active=0,
+                    currentvalue=dict(prefix=f"{self.config['chloro_time']}: "),
+                    pad=dict(t=10),
+                    x=0.1,
+                    len=0.9,
+                    steps=[
+                        dict(method="animate", label=label, args=[[label], play])
+                        for label in labels
+                    ],
+                )
+            ]
+            fig.layout.updatemenus = [
+                dict(
+                    type="buttons",
+                    showactive=False,
+                    x=0.1,
+                    xanchor="right",
+                    y=0,
+                    yanchor="top",
+                    pad=dict(t=10, r=10),
+                    buttons=[
+                        dict(label="Play", method="animate", args=[None, play]),
+                        dict(
+                            label="Pause",
+                            method="animate",
+                            args=[[None], dict(frame=dict(duration=0, redraw=False), mode="immediate")],
+                        ),
+                    ],
+                )
+            ]
 
         # Initialize base template (uses a mapbox style for background)
-        fig = go.Figure()
+        def _compact():
+            """Rounds line trace coordinates to the precision the zoom calls for and drops the vertices that repeat after rounding"""
+            decimals = self.config["coord_precision"]
+            if decimals is None:
+                center_lat = (
+                    (self.extent[1] + self.extent[3]) / 2 if self.extent is not None else 0
+                )
+                decimals = coord_precision(self.zoom, center_lat)
+            self.coord_decimals = decimals
+            dropped = 0
+            for trace in fig.data:
+                if trace.type == "scattermapbox" and trace.mode == "lines" and trace.lat is not None:
+                    lons, lats = compact_coords(trace.lon, trace.lat, decimals)
+                    dropped += len(trace.lat) - len(lats)
+                    trace.update(lon=lons, lat=lats)
+            return dropped
+
+        @contextmanager
+        def _group(group):
+            """Tags the traces and mapbox layers added in the block with their group (trace meta, layer name), so update() can replace them"""
+            traces, layer_count = len(fig.data), len(layers)
+            yield
+            for trace in fig.data[traces:]:
+                trace.meta = group
+            for layer in layers[layer_count:]:
+                layer["name"] = group
+
+        def _redraw(group):
+            """Whether a group is drawn this time: every group on a full draw, only those given on a partial redraw"""
+            return groups is None or group in groups
+
+        if groups is None:
+            fig = go.Figure()
+            self.fig = fig
+            layers = []  # mapbox layers (border_layer_toggle)
+        else:
+            # Patch the last drawn figure; the traces and layers of the groups being redrawn are dropped first
+            fig = self.fig
+            fig.data = [x for x in fig.data if x.meta not in groups]
+            layers = [
+                x.to_plotly_json()
+                for x in fig.layout.mapbox.layers
+                if x.name not in groups
+            ]
 
         # Execute drawing functions to build the map
-        if self.config["chloro_toggle"] == False:
-
-            _draw_countries()
-            _draw_subnats()
-            _draw_countries(outline=True)
-            _draw_labels()
-            _draw_irregulars()
-            _draw_markers()
-            _label_adjuster()
+        if self.config["chloro_toggle"] == True and _redraw("chloro"):
+            with self._stage("draw_chloro") as stage, _group("chloro"):
+                stage["features"] = _draw_chloro()
+        if _redraw("countries"):
+            with self._stage("draw_countries"), _group("countries"):
+                _draw_countries()
+        if _redraw("subnats"):
+            with self._stage("draw_subnats"), _group("subnats"):
+                _draw_subnats()
+        if _redraw("outlines"):
+            with self._stage("draw_outlines"), _group("outlines"):
+                _draw_countries(outline=True)
+        if _redraw("labels"):
+            with self._stage("draw_labels") as stage, _group("labels"):
+                _draw_labels()
+                stage["labels"] = len(self.label_df)
+        if self.config["irregular_feature_toggle"] == True and _redraw("irregulars"):
+            with self._stage("draw_irregulars"), _group("irregulars"):
+                _draw_irregulars()
+        if len(self.content.get("point_layers", [])) > 0 and _redraw("points"):
+            with self._stage("draw_points") as stage, _group("points"):
+                stage["rows"] = _draw_points()
+        if _redraw("markers"):
+            with self._stage("draw_markers"), _group("markers"):
+                _draw_markers()
+
+        if self.config["compact_toggle"] == True:
+            with self._stage("compact") as stage:
+                stage["vertices_dropped"] = _compact()
+
+        # Redrawn groups were added last; put them back in drawing order
+        if groups is not None:
+            order = {x: no for no, x in enumerate(DRAW_GROUPS)}
+            fig.data = sorted(fig.data, key=lambda x: order.get(x.meta, len(order)))
+            layers.sort(key=lambda x: order.get(x.get("name"), len(order)))
+
+        # The mapbox subplot (and its layers) is only rendered if at least one trace uses it
+        if len(fig.data) == 0:
+            fig.add_scattermapbox(lat=[], lon=[], showlegend=False)
+
+        # Layers beneath the traces would be painted over by the chloro map and density cells. plotly.js draws choropleth
+        # traces under every scatter trace, so line layers go right below the lowest scatter trace instead (on top if none)
+        for trace in fig.data:
+            if trace.uid == "above-fills":
+                trace.uid = None
+        if len(layers) > 0 and any(x.type == "choroplethmapbox" for x in fig.data):
+            scatters = [x for x in fig.data if x.type == "scattermapbox"]
+            below = ""
+            if len(scatters) > 0:
+                scatters[0].uid = "above-fills"
+                below = "plotly-trace-layer-above-fills-fill"
+            for layer in layers:
+                if layer["type"] == "line":
+                    layer["below"] = below
+        else:
+            for layer in layers:
+                layer["below"] = "traces"
 
+        if groups is not None:
+            fig.layout.mapbox.layers = layers
+        else:
             fig.update_layout(
                 coloraxis_showscale=True,
                 margin={"l": 0, "r": 0, "b": 0, "t": 25},
@@ -971,7 +1515,8 @@ class MapBuilder:
                 legend_title=dict(text="MW"),
                 mapbox=go.layout.Mapbox(
                     style="mapbox://styles/zbon/ckshpu8fb091a17p951bwv9hx",
-                    zoom=4.12,
+                    zoom=self.zoom,
+                    layers=layers,
                     accesstoken=self.token,
                     center_lat=self.label_df.loc[
                         self.content["country_list"][0], "centroid"
@@ -982,10 +1527,233 @@ class MapBuilder:
                 ),
             )
 
-        fig.show()
+        # Headless output if a path is given; otherwise opens in the browser
+        if self.config["output_path"] is not None:
+            self.export(self.config["output_path"])
+
+        self._profile(False)
+        if self.report is not None:
+            self.report["seconds"] += time.perf_counter() - t_draw
+            self.report["figure_bytes"] = len(fig.to_json().encode("utf-8"))
+        if self._profiler is not None:
+            self._write_profile()
+
+        # Redraws patch the figure already on display (see update)
+        if (
+            self.config["output_path"] is None
+            and self.config["display_toggle"] == True
+            and groups is None
+        ):
+            fig.show()
+
+        return fig
+
+    def update(self, settings: dict = None, content: dict = None, styling: dict = None):
+        """Applies new settings/content/styling to the last drawn map and returns the patched figure (watch mode, see watch.py)
+
+        Keys are compared against the current dictionaries; only the trace groups the changed keys are drawn into are
+        recomputed and replaced (see REDRAW_GROUPS), while any other change rebuilds the map from the builder's MapData.
+        Pass new dictionaries rather than editing the current ones in place, which would leave nothing to compare against.
+        """
+        new = {
+            "settings": settings if settings is not None else self.config,
+            "content": content if content is not None else self.content,
+            "styling": styling if styling is not None else self.styling,
+        }
+        old = {"settings": self.config, "content": self.content, "styling": self.styling}
+
+        groups = set()
+        rebuild = getattr(self, "fig", None) is None
+        for section in new:
+            for key in set(new[section]) | set(old[section]):
+                if new[section].get(key) == old[section].get(key):
+                    continue
+                if key not in REDRAW_GROUPS[section]:
+                    rebuild = True
+                groups.update(REDRAW_GROUPS[section].get(key, []))
+
+        if rebuild:
+            self.__init__(
+                self.token, new["settings"], new["content"], new["styling"], data=self.data
+            )
+            return self.draw_map()
+
+        # New city names have to be looked up; new label positions only need the markers redrawn
+        new_cities = [x[0] for x in new["content"]["city_list"]] != [
+            x[0] for x in self.content["city_list"]
+        ]
+        self.config, self.content, self.styling = new["settings"], new["content"], new["styling"]
+        self.stage_times = {}
+        if self.report is not None:
+            self.report = {"stages": [], "figure_bytes": None, "seconds": 0}
+
+        if (
+            new_cities
+            and self.config["city_toggle"] == True
+            and len(self.content["city_list"]) > 0
+        ):
+            with self._stage("city_ingest") as stage:
+                self._ingest_cities()
+                stage["rows"] = len(self.city_db)
+        return self.draw_map(groups=groups)
+
+    def _payload(self):
+        """The figure to serialize; with compact_toggle on, trace lat/lon and frame values are written as base64 typed arrays (plotly.js >= 2.28)"""
+        if self.config["compact_toggle"] == False:
+            return self.fig
+        payload = self.fig.to_plotly_json()
+        # float32 holds ~7 significant digits: enough for 4 decimals of longitude
+        dtype = "f4" if getattr(self, "coord_decimals", 5) <= 4 else "f8"
+        for trace in payload["data"]:
+            for key in ["lat", "lon"]:
+                if trace.get(key) is None or len(trace[key]) == 0:
+                    continue
+                trace[key] = _typed_array(trace[key], dtype)
+        # Animation frames (chloro_time) carry one value array each; 7 significant digits are plenty for a color scale
+        for frame in payload.get("frames", []):
+            for trace in frame.get("data", []):
+                if trace.get("z") is not None and len(trace["z"]) > 0:
+                    trace["z"] = _typed_array(trace["z"], "f4")
+        return payload
+
+    def _profile(self, on: bool):
+        """Resumes/pauses the profiler (profiler setting) around __init__ and draw_map"""
+        if self._profiler is None:
+            return
+        if self.config["profiler"] == "cprofile":
+            if on:
+                self._profiler.enable()
+            else:
+                self._profiler.disable()
+        else:
+            if on:
+                self._profiler.start()
+            else:
+                self._profiler.stop()
+
+    def _write_profile(self):
+        """Writes the profile to profile_path (cProfile stats file, pyinstrument html) or prints a summary to stderr"""
+        path = self.config["profile_path"]
+        if self.config["profiler"] == "cprofile":
+            if path is not None:
+                self._profiler.dump_stats(path)
+            else:
+                pstats.Stats(self._profiler, stream=sys.stderr).sort_stats(
+                    "cumulative"
+                ).print_stats(30)
+        else:
+            if path is not None:
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(self._profiler.output_html())
+            else:
+                print(self._profiler.output_text(), file=sys.stderr)
+
+    def print_report(self, file=sys.stderr):
+        """Prints the instrumentation report as a table"""
+        print(
+            f"{'stage':28}{'seconds':>10}{'peak MB':>10}{'features':>10}{'traces':>8}{'vertices':>10}",
+            file=file,
+        )
+        for x in self.report["stages"]:
+            name = ("  " + x["stage"]) if x["parent"] is not None else x["stage"]
+            count = x.get("features", x.get("rows", x.get("labels", "")))
+            print(
+                f"{name:28}{x['seconds']:10.4f}{x['peak_memory'] / 1e6:10.2f}{count:>10}{x['traces_added']:8}{x['vertices']:10}",
+                file=file,
+            )
+        print(
+            f"total {self.report['seconds']:.4f}s, figure json {self.report['figure_bytes']:,} bytes",
+            file=file,
+        )
+
+    def export(self, out, fmt: str = None):
+        """Writes the last drawn map to a path or a file-like buffer as self-contained html, figure json or a static image (png, svg, pdf, jpeg, webp)"""
+        if fmt is None:
+            fmt = (
+                Path(out).suffix.lstrip(".").lower()
+                if isinstance(out, (str, Path))
+                else "html"
+            )
+        fmt = "jpeg" if fmt == "jpg" else fmt
+
+        if fmt == "html":
+            import plotly.io as pio
+
+            data = pio.to_html(
+                self._payload(),
+                include_plotlyjs=True,
+                full_html=True,
+                default_width=self.config["output_width"] or "100%",
+                default_height=self.config["output_height"] or "100%",
+                validate=False,
+            ).encode("utf-8")
+        elif fmt == "json":
+            import plotly.io as pio
+
+            data = pio.to_json(self._payload(), validate=False).encode("utf-8")
+        elif fmt in STATIC_FORMATS:
+            import plotly.io as pio
+
+            # One kaleido process serves every thread; exports take turns
+            with _renderer_lock:
+                _start_renderer()
+                data = pio.to_image(
+                    self.fig,
+                    format=fmt,
+                    width=self.config["output_width"],
+                    height=self.config["output_height"],
+                    scale=self.config["output_scale"],
+                )
+        else:
+            raise ValueError(f"Unsupported output format: {fmt}")
+
+        if isinstance(out, (str, Path)):
+            with open(out, "wb") as file:
+                file.write(data)
+        else:
+            out.write(data)
+        return data
+
+
+def _typed_array(values, dtype: str):
+    """A plotly.js typed array spec ({dtype, bdata}) of a sequence of numbers"""
+    values = np.asarray(values, dtype="float64").astype(dtype)
+    return {"dtype": dtype, "bdata": base64.b64encode(values.tobytes()).decode("ascii")}
+
+
+def _make_profiler(kind: str):
+    """A cProfile or pyinstrument profiler, per the profiler setting"""
+    if kind == "cprofile":
+        return cProfile.Profile()
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("The pyinstrument profiler requires pyinstrument (pip install pyinstrument)")
+        return Profiler()
+    raise ValueError(f"Unknown profiler: {kind}")
+
+
+def _start_renderer():
+    """Keeps a single kaleido rendering process alive for every static export made by this process"""
+    global _renderer_started
+    if _renderer_started:
+        return
+    import kaleido
+
+    # kaleido >= 1.0 starts a browser per export unless a sync server is running; older versions keep one subprocess by default
+    if hasattr(kaleido, "start_sync_server"):
+        kaleido.start_sync_server(silence_warnings=True)
+    _renderer_started = True
 
 
 if __name__ == "__main__":
+    # Help/Readme (before anything is loaded)
+    if "-h" in sys.argv:
+        with open(Path(__file__).parent / "cline.txt", "r") as file:
+            print(file.read())
+        sys.exit()
+
     # load config
     map_token = os.getenv("MAP_TOKEN")
 
@@ -995,6 +1763,8 @@ if __name__ == "__main__":
         )
         sys.exit(1)
 
+    import pandas as pd
+
     pd.set_option("mode.chained_assignment", None)
     pd.set_option("display.max_rows", None)
     pd.set_option("display.max_colwidth", None)
@@ -1006,9 +1776,24 @@ if __name__ == "__main__":
         command_list = [
             "-h",
             "-mtoken",
+            "-geomirror",
+            "-out",
+            "-width",
+            "-height",
+            "-scale",
+            "-compact",
+            "-precision",
+            "-instrument",
+            "-profile",
+            "-profile_out",
             "-natlabels",
             "-snats",
             "-snatlabels",
+            "-zoom",
+            "-nolod",
+            "-border_layers",
+            "-interior_rings",
+            "-marker_traces",
             "-nat_list",
             "-snat_list",
             "-city_list",
@@ -1032,6 +1817,15 @@ if __name__ == "__main__":
             "-labelpos",
             "-labeladjust",
             "-cfeature",
+            "-feature_extent",
+            "-chloro",
+            "-chloro_layer",
+            "-colorscale",
+            "-chloro_time",
+            "-chloro_period",
+            "-frame_ms",
+            "-points",
+            "-cell_size",
             "-feature_color",
             "-feature_fill_opacity",
             "-feature_border_opacity",
@@ -1054,15 +1848,47 @@ if __name__ == "__main__":
                 pass
 
         # Adjust toggles based on command line arguments
-        # Help/Readme
-        if "-h" in sys.argv:
-            with open("cline.txt", "r") as file:
-                print(file.read())
         # Token override
         if "-mtoken" in sys.argv:
             token_index = sys.argv.index("-mtoken")
             map_token = sys.argv[formatting_index + 1]
 
+        # GeoNames mirror (local directory or base URL holding <ISO>.zip dumps)
+        if "-geomirror" in sys.argv:
+            mirror_index = sys.argv.index("-geomirror")
+            map_settings["geonames_mirror"] = sys.argv[mirror_index + 1]
+
+        # Headless output
+        if "-out" in sys.argv:
+            out_index = sys.argv.index("-out")
+            map_settings["output_path"] = sys.argv[out_index + 1]
+        if "-width" in sys.argv:
+            out_index = sys.argv.index("-width")
+            map_settings["output_width"] = int(sys.argv[out_index + 1])
+        if "-height" in sys.argv:
+            out_index = sys.argv.index("-height")
+            map_settings["output_height"] = int(sys.argv[out_index + 1])
+        if "-scale" in sys.argv:
+            out_index = sys.argv.index("-scale")
+            map_settings["output_scale"] = float(sys.argv[out_index + 1])
+
+        # Payload compaction
+        if "-compact" in sys.argv:
+            map_settings["compact_toggle"] = True
+        if "-precision" in sys.argv:
+            precision_index = sys.argv.index("-precision")
+            map_settings["coord_precision"] = int(sys.argv[precision_index + 1])
+
+        # Instrumentation/profiling
+        if "-instrument" in sys.argv:
+            map_settings["instrument_toggle"] = True
+        if "-profile" in sys.argv:
+            profile_index = sys.argv.index("-profile")
+            map_settings["profiler"] = sys.argv[profile_index + 1]
+        if "-profile_out" in sys.argv:
+            profile_index = sys.argv.index("-profile_out")
+            map_settings["profile_path"] = sys.argv[profile_index + 1]
+
         # Features Customization
         if "-snat_list" in sys.argv:
             snats_index = sys.argv.index("-snat_list")
@@ -1093,6 +1919,49 @@ if __name__ == "__main__":
                 )
             map_content["irregular_markers"] = cfeature_list
 
+        # Only load custom features overlapping the mapped countries
+        if "-feature_extent" in sys.argv:
+            map_settings["feature_extent_toggle"] = True
+
+        # Chloro map from the csv directory; format as key_column>value_column>aggregation (value and aggregation optional)
+        if "-chloro" in sys.argv:
+            chloro_index = sys.argv.index("-chloro")
+            splitd = sys.argv[chloro_index + 1].split(">")
+            map_settings["chloro_toggle"] = True
+            map_settings["chloro_key"] = splitd[0]
+            map_settings["chloro_value"] = splitd[1] if len(splitd) > 1 else None
+            map_settings["chloro_agg"] = splitd[2] if len(splitd) > 2 else "sum"
+        if "-chloro_layer" in sys.argv:
+            chloro_index = sys.argv.index("-chloro_layer")
+            map_settings["chloro_layer"] = sys.argv[chloro_index + 1]
+        if "-colorscale" in sys.argv:
+            chloro_index = sys.argv.index("-colorscale")
+            map_settings["chloro_colorscale"] = sys.argv[chloro_index + 1]
+        # Animated chloro map; one frame per period of the date column
+        if "-chloro_time" in sys.argv:
+            chloro_index = sys.argv.index("-chloro_time")
+            map_settings["chloro_time"] = sys.argv[chloro_index + 1]
+        if "-chloro_period" in sys.argv:
+            chloro_index = sys.argv.index("-chloro_period")
+            period = sys.argv[chloro_index + 1]
+            map_settings["chloro_period"] = None if period == "none" else period
+        if "-frame_ms" in sys.argv:
+            chloro_index = sys.argv.index("-frame_ms")
+            map_settings["chloro_frame_duration"] = int(sys.argv[chloro_index + 1])
+
+        # Point layers; format as path>mode>lon_column>lat_column (mode and columns optional), multiple joined with +
+        if "-points" in sys.argv:
+            points_index = sys.argv.index("-points")
+            for x in sys.argv[points_index + 1].split("+"):
+                splitd = x.split(">")
+                layer = {"path": splitd[0], "mode": splitd[1] if len(splitd) > 1 else "scatter"}
+                if len(splitd) > 3:
+                    layer["lon"], layer["lat"] = splitd[2], splitd[3]
+                map_content["point_layers"].append(layer)
+        if "-cell_size" in sys.argv:
+            points_index = sys.argv.index("-cell_size")
+            map_settings["point_cell_size"] = float(sys.argv[points_index + 1])
+
         # Display Toggles
         if "-snats" in sys.argv:
             map_settings["subnat_toggle"] = True
@@ -1100,6 +1969,18 @@ if __name__ == "__main__":
             map_settings["subnat_label_toggle"] = True
         if "-natlabels" in sys.argv:
             map_settings["nat_label_toggle"] = True
+        if "-zoom" in sys.argv:
+            zoom_index = sys.argv.index("-zoom")
+            zoom = sys.argv[zoom_index + 1]
+            map_settings["zoom"] = None if zoom == "fit" else float(zoom)
+        if "-nolod" in sys.argv:
+            map_settings["lod_toggle"] = False
+        if "-border_layers" in sys.argv:
+            map_settings["border_layer_toggle"] = True
+        if "-interior_rings" in sys.argv:
+            map_settings["interior_rings_toggle"] = True
+        if "-marker_traces" in sys.argv:
+            map_settings["marker_batch_toggle"] = False
 
         # Formatting Toggles
         if "-background_color" in sys.argv:
@@ -1210,3 +2091,11 @@ if __name__ == "__main__":
     m = MapBuilder(map_token, map_settings, map_content, map_styling)
 
     m.draw_map()
+
+    # Instrumentation report; also written as json if a path follows -instrument
+    if m.report is not None:
+        m.print_report()
+        instrument_index = sys.argv.index("-instrument")
+        if instrument_index + 1 < len(sys.argv) and not sys.argv[instrument_index + 1].startswith("-"):
+            with open(sys.argv[instrument_index + 1], "w", encoding="utf-8") as report_file:
+                json.dump(m.report, report_file, indent=2)
@@ -0,0 +1,183 @@
+"""High-volume point layers: lon/lat columns of CSV or Parquet files, aggregated before they are plotted.
+
+Points are read straight into arrays and binned in Web Mercator pixel space at the map's zoom,
+so cells are the same size on screen anywhere on the map. Render modes:
+
+- grid / hexbin: density cells (squares or hexagons) colored by point count or summed weight;
+- cluster: one marker per cell at the mean position of its points, labelled with their count;
+- scatter: every point, merged when they fall on the same pixel and sampled down to a cap.
+
+Each mode draws at most a fixed number of cells or points (cells grow until they fit), so the
+figure stays the same size however many rows the input has. Coordinates are rounded to the
+precision the zoom can show.
+"""
+from pathlib import Path
+
+import numpy as np
+
+from geostore import TILE_SIZE, coord_precision
+
+
+MODES = ["grid", "hexbin", "cluster", "scatter"]
+
+PARQUET_SUFFIXES = [".parquet", ".pq"]
+
+# Web Mercator latitude limit
+MAX_LAT = 85.0511
+
+
+def read_points(path, lon: str = "lon", lat: str = "lat", weight: str = None):
+    """lon, lat (and weight) arrays of a CSV or Parquet file's columns; rows without valid coordinates are dropped"""
+    import pandas as pd
+
+    columns = [lon, lat] + ([weight] if weight is not None else [])
+    if Path(path).suffix.lower() in PARQUET_SUFFIXES:
+        try:
+            frame = pd.read_parquet(path, columns=columns)
+        except ImportError:
+            raise ImportError("Parquet point layers require pyarrow (pip install pyarrow)")
+    else:
+        frame = pd.read_csv(
+            path,
+            usecols=columns,
+            dtype={x: "float64" for x in columns},
+            encoding="utf-8-sig",
+        )
+
+    lons = frame[lon].to_numpy(dtype="float64")
+    lats = frame[lat].to_numpy(dtype="float64")
+    valid = (
+        np.isfinite(lons) & np.isfinite(lats) & (np.abs(lons) <= 180) & (np.abs(lats) <= MAX_LAT)
+    )
+    weights = None
+    if weight is not None:
+        weights = np.nan_to_num(frame[weight].to_numpy(dtype="float64"))[valid]
+    return {"lon": lons[valid], "lat": lats[valid], "weight": weights}
+
+
+def _project(lons, lats, zoom: float):
+    """Web Mercator pixel coordinates at zoom"""
+    scale = TILE_SIZE * 2**zoom
+    lat = np.radians(lats)
+    x = (lons + 180) / 360 * scale
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * scale
+    return x, y
+
+
+def _unproject(x, y, zoom: float):
+    scale = TILE_SIZE * 2**zoom
+    lons = x / scale * 360 - 180
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / scale))))
+    return lons, lats
+
+
+def _unique_bins(a, b):
+    """Distinct (a, b) integer bins: their coordinates, the first point in each and each point's bin
+
+    Pairs are packed into one int64 relative to their minimum; at most 2**31 pixels across (zoom 22) that can't overflow.
+    """
+    b0 = b.min()
+    span = int(b.max() - b0) + 1
+    keys, first, inverse = np.unique(
+        (a - a.min()) * span + (b - b0), return_index=True, return_inverse=True
+    )
+    return a[first], b[first], first, inverse
+
+
+def _grid_bins(x, y, cell: float):
+    """Square (column, row), cell pixels wide, holding each point"""
+    return np.floor(x / cell).astype("int64"), np.floor(y / cell).astype("int64")
+
+
+def _hex_bins(x, y, cell: float):
+    """Hexagon (axial q, r; pointy-top, cell pixels wide) holding each point"""
+    size = cell / np.sqrt(3)
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    # Cube rounding: round all three coordinates, then fix the one that moved most
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype("int64"), rr.astype("int64")
+
+
+def _bin(mode: str, x, y, cell: float):
+    a, b = _hex_bins(x, y, cell) if mode == "hexbin" else _grid_bins(x, y, cell)
+    a, b, first, inverse = _unique_bins(a, b)
+    return a, b, inverse
+
+
+def _cell_outlines(mode: str, a, b, cell: float, zoom: float):
+    """[cells, vertices, 2] lon/lat outlines (closed rings) of bins"""
+    if mode == "hexbin":
+        size = cell / np.sqrt(3)
+        cx = size * (np.sqrt(3) * a + np.sqrt(3) / 2 * b)
+        cy = size * 1.5 * b
+        angles = np.radians(np.arange(7) * 60 - 30)
+        x = cx[:, None] + size * np.cos(angles)[None, :]
+        y = cy[:, None] + size * np.sin(angles)[None, :]
+    else:
+        x = (a[:, None] + np.array([0, 1, 1, 0, 0])[None, :]) * cell
+        y = (b[:, None] + np.array([0, 0, 1, 1, 0])[None, :]) * cell
+    lons, lats = _unproject(x, y, zoom)
+    return np.stack([lons, lats], axis=-1)
+
+
+def aggregate_points(
+    points: dict, mode: str, zoom: float, cell: float = 24, max_cells: int = 20_000, max_points: int = 50_000
+):
+    """Aggregates a point layer for drawing at zoom (see MODES); cell is the bin width/cluster radius in pixels
+
+    grid/hexbin: {"cells": lon/lat outlines, "values": count or summed weight per cell}
+    cluster: {"lon", "lat", "counts", "values"} per cluster (mean position of its points)
+    scatter: {"lon", "lat"} of at most max_points points
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown point layer mode: {mode} (expected one of {', '.join(MODES)})")
+    if len(points["lon"]) == 0:
+        empty = np.zeros(0)
+        if mode == "scatter":
+            return {"lon": empty, "lat": empty}
+        if mode == "cluster":
+            return {"lon": empty, "lat": empty, "counts": np.zeros(0, dtype="int64"), "values": empty}
+        return {"cells": np.zeros((0, 0, 2)), "values": empty}
+    x, y = _project(points["lon"], points["lat"], zoom)
+    weights = points["weight"]
+    decimals = coord_precision(zoom, float(np.median(points["lat"])))
+
+    if mode == "scatter":
+        # Points on the same pixel draw the same; keep one, then sample evenly if there are still too many
+        keep = np.sort(_unique_bins(*_grid_bins(x, y, 1))[2])
+        if len(keep) > max_points:
+            rng = np.random.default_rng(0)
+            keep = np.sort(rng.choice(keep, max_points, replace=False))
+        return {
+            "lon": np.round(points["lon"][keep], decimals),
+            "lat": np.round(points["lat"][keep], decimals),
+        }
+
+    # Coarser cells until the layer fits in max_cells
+    cell = max(float(cell), 1.0)
+    a, b, inverse = _bin(mode, x, y, cell)
+    while len(a) > max_cells:
+        cell *= 2
+        a, b, inverse = _bin(mode, x, y, cell)
+
+    n = len(a)
+    counts = np.bincount(inverse, minlength=n)
+    values = counts.astype("float64") if weights is None else np.bincount(inverse, weights, n)
+    if mode == "cluster":
+        lons, lats = _unproject(
+            np.bincount(inverse, x, n) / counts, np.bincount(inverse, y, n) / counts, zoom
+        )
+        return {
+            "lon": np.round(lons, decimals),
+            "lat": np.round(lats, decimals),
+            "counts": counts,
+            "values": values,
+        }
+    return {"cells": np.round(_cell_outlines(mode, a, b, cell, zoom), decimals), "values": values}
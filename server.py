@@ -0,0 +1,226 @@
+"""Local render service keeping the map datasets warm between requests.
+
+    python server.py [-port 8050] [-host 127.0.0.1] [-socket /path/to/mapper.sock]
+
+POST /render with a JSON body in the MapBuilder schema; every section is optional and
+overrides the defaults of mapper.py:
+
+    {"settings": {...}, "content": {"country_list": ["Ukraine"]}, "styling": {...},
+     "format": "html" | "json" | "png" | "svg" | "pdf" | "jpeg" | "webp"}
+
+The response body is the rendered map (default html); its render time is reported in the
+X-Render-Time header (seconds) and logged. GET /health returns the request count and
+latency summary.
+
+The geometry store, ISO table and ingested GeoNames caches are loaded once at startup into
+one MapData shared by every request thread; streamed custom features are kept per extent.
+"""
+import copy
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import plotly.graph_objects as go
+
+import mapper
+
+
+CONTENT_TYPES = {
+    "html": "text/html; charset=utf-8",
+    "json": "application/json",
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+# Settings naming files or download sources on the server, or turning on profiler-style diagnostics (tracemalloc);
+# requests can't override them
+LOCKED_SETTINGS = ["output_path", "display_toggle", "profiler", "profile_path", "geonames_mirror", "instrument_toggle"]
+
+
+def warm_data(data: mapper.MapData):
+    """Loads everything a request could need up front: the shared datasets (see MapData.warm), plotly validators"""
+    data.warm()
+    # plotly imports its trace and layout validators on first use
+    go.Figure(go.Scattermapbox(), layout=dict(mapbox=dict(layers=[{}]))).to_json()
+
+
+class RenderService:
+    """Renders map requests against one shared MapData and keeps latency statistics"""
+
+    def __init__(self, token: str, data: mapper.MapData):
+        self.token = token
+        self.data = data
+        self.latencies = []
+        self._stats_lock = threading.Lock()
+
+    def render(self, request: dict):
+        """Returns (body, content type, seconds) for a request in the MapBuilder schema"""
+        t = time.perf_counter()
+        fmt = request.get("format", "html").lower()
+        fmt = "jpeg" if fmt == "jpg" else fmt
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported output format: {fmt}")
+
+        settings = copy.deepcopy(mapper.map_settings)
+        settings.update(request.get("settings", {}))
+        settings.update({x: mapper.map_settings[x] for x in LOCKED_SETTINGS})
+        settings.update(output_path=None, display_toggle=False)
+        content = copy.deepcopy(mapper.map_content)
+        content.update(request.get("content", {}))
+        # Point layers are only read from within the data directory
+        root = self.data.root.resolve()
+        for layer in content.get("point_layers", []):
+            if not isinstance(layer, dict) or not isinstance(layer.get("path"), str):
+                raise ValueError(f"Point layer needs a path: {layer}")
+            if not (root / layer["path"]).resolve().is_relative_to(root):
+                raise ValueError(f"Point layer outside the data directory: {layer['path']}")
+        styling = copy.deepcopy(mapper.map_styling)
+        styling.update(request.get("styling", {}))
+
+        m = mapper.MapBuilder(self.token, settings, content, styling, data=self.data)
+        m.draw_map()
+        body = m.export(io.BytesIO(), fmt)
+
+        seconds = time.perf_counter() - t
+        with self._stats_lock:
+            self.latencies.append(seconds)
+        return body, CONTENT_TYPES[fmt], seconds
+
+    def stats(self):
+        """Request count and latency percentiles (seconds)"""
+        with self._stats_lock:
+            latencies = np.array(self.latencies)
+        if len(latencies) == 0:
+            return {"requests": 0}
+        return {
+            "requests": len(latencies),
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "max": float(latencies.max()),
+        }
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    # Set on the server class by serve()
+    service = None
+
+    def _reply(self, status: int, body: bytes, content_type: str, headers: dict = {}):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._reply(404, b"Not found\n", "text/plain")
+            return
+        body = json.dumps(dict(self.service.stats(), status="ok")).encode("utf-8")
+        self._reply(200, body, "application/json")
+
+    def do_POST(self):
+        if self.path != "/render":
+            self._reply(404, b"Not found\n", "text/plain")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(400, b"Request body must be JSON\n", "text/plain")
+            return
+
+        try:
+            body, content_type, seconds = self.service.render(request)
+        except ValueError as error:
+            self._reply(400, f"{error}\n".encode("utf-8"), "text/plain")
+            return
+        except Exception:
+            # The traceback stays in the server log (stderr); clients only learn that the render failed
+            self.log_error("render failed")
+            traceback.print_exc()
+            self._reply(500, b"Internal server error\n", "text/plain")
+            return
+        self._reply(
+            200, body, content_type, {"X-Render-Time": f"{seconds:.4f}"}
+        )
+        self.log_message(
+            "rendered %s (%s, %d bytes) in %.3fs",
+            "+".join(request.get("content", {}).get("country_list", [])),
+            content_type,
+            len(body),
+            seconds,
+        )
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "local"
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(token: str, host: str = "127.0.0.1", port: int = 8050, socket_path: str = None, root: Path = None):
+    """Loads the datasets once and serves render requests until interrupted"""
+    t = time.perf_counter()
+    data = mapper.MapData(root) if root is not None else mapper.MapData()
+    warm_data(data)
+    RenderHandler.service = RenderService(token, data)
+
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, RenderHandler)
+        where = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), RenderHandler)
+        where = f"http://{host}:{port}"
+    print(f"Datasets loaded in {time.perf_counter() - t:.2f}s; serving on {where}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    map_token = os.getenv("MAP_TOKEN")
+
+    if not map_token:
+        print(
+            "Missing env values for MAP_TOKEN; Mapbox token required to create base map"
+        )
+        sys.exit(1)
+
+    host, port, socket_path = "127.0.0.1", 8050, None
+    if "-host" in sys.argv:
+        host_index = sys.argv.index("-host")
+        host = sys.argv[host_index + 1]
+    if "-port" in sys.argv:
+        port_index = sys.argv.index("-port")
+        port = int(sys.argv[port_index + 1])
+    if "-socket" in sys.argv:
+        socket_index = sys.argv.index("-socket")
+        socket_path = sys.argv[socket_index + 1]
+
+    warnings.filterwarnings("ignore")
+    serve(map_token, host, port, socket_path)
@@ -0,0 +1,17 @@
+import sys
+import warnings
+from pathlib import Path
+
+import pytest
+
+# The modules live at the repository root (no package)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.fixtures import SCENARIOS, make_fixtures
+
+
+@pytest.fixture(scope="session")
+def small_root(tmp_path_factory):
+    """Synthetic data directory of the small benchmark scenario, with a compiled store"""
+    warnings.filterwarnings("ignore")
+    return make_fixtures(tmp_path_factory.mktemp("small"), SCENARIOS["small"])
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from choropleth import AGGREGATIONS, aggregate_csv
+
+
+@pytest.fixture
+def csv_paths(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for no in range(2):
+        frame = pd.DataFrame(
+            {
+                "region": rng.choice(["AAA", "BBB", "CCC", "DDD"], 500),
+                "value": rng.normal(10, 5, 500).round(3),
+                "date": pd.Timestamp("2024-01-01")
+                + pd.to_timedelta(rng.integers(0, 90, 500), unit="D"),
+            }
+        )
+        frame.to_csv(tmp_path / f"csv_{no}.csv", index=False)
+        paths.append(tmp_path / f"csv_{no}.csv")
+    return paths
+
+
+def _rows(paths):
+    return pd.concat([pd.read_csv(x, dtype={"region": str}) for x in paths])
+
+
+@pytest.mark.parametrize("how", list(AGGREGATIONS))
+def test_aggregate_matches_groupby(csv_paths, how):
+    # Chunks much smaller than a file, so partials are combined across chunks and files
+    out = aggregate_csv(csv_paths, "region", "value", how, chunk_rows=37)
+    groups = _rows(csv_paths).groupby("region")
+    expected = groups.size() if how == "count" else groups["value"].agg(how)
+    pd.testing.assert_series_equal(
+        out.sort_index(), expected.astype("float64"), check_names=False, check_index_type=False
+    )
+
+
+def test_aggregate_by_period_matches_groupby(csv_paths):
+    out = aggregate_csv(csv_paths, "region", "value", "sum", time="date", period="M", chunk_rows=37)
+    rows = _rows(csv_paths)
+    rows["frame"] = pd.to_datetime(rows["date"]).dt.to_period("M").dt.start_time.dt.strftime("%Y-%m-%d")
+    expected = rows.groupby(["region", "frame"])["value"].sum().unstack()
+    assert list(out.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(
+        out.sort_index(), expected, check_names=False, check_index_type=False
+    )
+
+
+def test_aggregate_needs_value_column(csv_paths):
+    with pytest.raises(ValueError):
+        aggregate_csv(csv_paths, "region", None, "sum")
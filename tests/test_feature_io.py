@@ -0,0 +1,76 @@
+import json
+import os
+
+import numpy as np
+
+from feature_io import FeatureCache, _scan_features, iter_features
+
+
+def _features(n: int):
+    return [
+        {
+            "type": "Feature",
+            "properties": {"name": f"Road {i}", "note": "comma, ] bracket"},
+            "geometry": {"type": "LineString", "coordinates": [[i, 0.5], [i + 1.25, 1], [i + 2, -3.5]]},
+        }
+        for i in range(n)
+    ] + [{"type": "Feature", "properties": {"name": "No geometry"}, "geometry": None}]
+
+
+def test_scan_matches_json_load(tmp_path):
+    path = tmp_path / "feature_1.geojson"
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"type": "FeatureCollection", "name": "roads", "features": _features(50)}, file, indent=1)
+    with open(path, "r", encoding="utf-8") as file:
+        expected = json.load(file)["features"]
+
+    # Chunks far smaller than a feature make every object straddle a buffer boundary
+    for chunk_size in [7, 64, 1 << 20]:
+        with open(path, "r", encoding="utf-8") as file:
+            assert list(_scan_features(file, chunk_size)) == expected
+    assert list(iter_features(path)) == [x for x in expected if x["geometry"] is not None]
+
+
+def test_ndjson_matches_json_load(tmp_path):
+    features = _features(20)
+    path = tmp_path / "feature_1.geojsonl"
+    with open(path, "w", encoding="utf-8") as file:
+        for x in features:
+            file.write("\x1e" + json.dumps(x) + "\n\n")
+    assert list(iter_features(path)) == [x for x in features if x["geometry"] is not None]
+
+
+def test_iter_features_bounds(tmp_path):
+    path = tmp_path / "feature_1.geojson"
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"type": "FeatureCollection", "features": _features(10)}, file)
+    names = [x["properties"]["name"] for x in iter_features(path, [4.5, -5, 5.5, 5])]
+    assert names == ["Road 3", "Road 4", "Road 5"]
+
+
+def test_feature_cache_invalidates_on_edit(tmp_path):
+    path = tmp_path / "feature_1.geojson"
+    cache = FeatureCache(tmp_path / ".cache")
+
+    def write(n: int, mtime: int):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"type": "FeatureCollection", "features": _features(n)}, file)
+        os.utime(path, (mtime, mtime))
+
+    write(2, 1_000_000)
+    (lons, lats), count = cache.coords(path)
+    assert count == 2
+    assert np.isfinite(lons).sum() == 6
+
+    # Touched without a content change: the stored arrays are kept
+    os.utime(path, (2_000_000, 2_000_000))
+    assert cache.coords(path)[1] == 2
+    assert isinstance(cache.crunched(path)["lons"], np.memmap)
+
+    # Edited: the file is crunched again
+    write(5, 3_000_000)
+    (lons, lats), count = cache.coords(path)
+    assert count == 5
+    assert np.isfinite(lons).sum() == 15
+    # and a fresh cache over the same directory agrees
+    assert FeatureCache(tmp_path / ".cache").coords(path)[1] == 5
@@ -0,0 +1,119 @@
+import copy
+import json
+
+import numpy as np
+import pytest
+
+import mapper
+from geostore import INDEX_KEYS, LAYERS, open_store, simplify_features
+
+
+def _geojson(root, layer):
+    with open(root / "maps" / LAYERS[layer][0], "r", encoding="utf-8") as file:
+        return json.load(file)["features"]
+
+
+@pytest.mark.parametrize("layer", ["nat", "subnat"])
+def test_store_features_match_geojson(small_root, layer):
+    store = open_store(small_root / "maps")
+    assert store is not None
+    source = _geojson(small_root, layer)
+    key = LAYERS[layer][1]
+    countries = sorted({x["properties"][key] for x in source})
+
+    for country in countries:
+        expected = [x for x in source if x["properties"][key] == country]
+        features = store.features(layer, [country])
+        assert [x["properties"] for x in features] == [x["properties"] for x in expected]
+        assert [x["geometry"] for x in features] == [x["geometry"] for x in expected]
+
+
+@pytest.mark.parametrize("layer", ["nat", "subnat"])
+def test_store_lookup_matches_geojson(small_root, layer):
+    store = open_store(small_root / "maps")
+    source = _geojson(small_root, layer)
+    country_key = LAYERS[layer][1]
+
+    for key in INDEX_KEYS[layer]:
+        for feature in source:
+            value = feature["properties"][key]
+            country = feature["properties"][country_key]
+            found = store.features_at(layer, store.lookup(layer, value, [key], [country]))
+            expected = [
+                x["properties"]
+                for x in source
+                if x["properties"][key] == value and x["properties"][country_key] == country
+            ]
+            assert [x["properties"] for x in found] == expected
+
+
+def test_builder_layers_match_without_store(small_root):
+    settings = copy.deepcopy(mapper.map_settings)
+    settings.update(subnat_toggle=True, lod_toggle=False, display_toggle=False, output_path=None)
+    content = copy.deepcopy(mapper.map_content)
+    countries = sorted({x["properties"]["ADMIN"] for x in _geojson(small_root, "nat")})
+    content.update(country_list=countries[:2], city_list=[])
+
+    stored = mapper.MapData(small_root)
+    plain = mapper.MapData(small_root)
+    plain.store = None
+    assert stored.store is not None
+
+    for layer in ["nat", "subnat"]:
+        a, b = (
+            mapper.MapBuilder("tok", settings, content, mapper.map_styling, data=x)._load_layer(layer)["features"]
+            for x in [stored, plain]
+        )
+        assert [x["properties"] for x in a] == [x["properties"] for x in b]
+        assert [x["geometry"] for x in a] == [x["geometry"] for x in b]
+        np.testing.assert_allclose([x["anchor"] for x in a], [x["anchor"] for x in b])
+        np.testing.assert_allclose([x["area"] for x in a], [x["area"] for x in b])
+
+
+def _tiles(n: int):
+    """n x n unit squares whose shared edges wiggle (each edge generated once, so neighbours hold the same vertices)"""
+    rng = np.random.default_rng(0)
+    edges = {}
+
+    def edge(a, b):
+        if (b, a) in edges:
+            return edges[(b, a)][::-1]
+        t = np.linspace(0, 1, 60)[1:-1, None]
+        normal = np.array([a[1] - b[1], b[0] - a[0]])
+        edges[(a, b)] = np.array(a) + t * (np.array(b) - np.array(a)) + (0.03 * np.sin(9 * t) + rng.normal(0, 0.004, t.shape)) * normal
+        return edges[(a, b)]
+
+    features = []
+    for i in range(n):
+        for j in range(n):
+            corners = [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1)]
+            ring = []
+            for a, b in zip(corners, corners[1:] + corners[:1]):
+                ring.extend([a, *edge(a, b).tolist()])
+            features.append(
+                {
+                    "type": "Feature",
+                    "properties": {"name": f"Tile {i} {j}"},
+                    "geometry": {"type": "Polygon", "coordinates": [ring + [ring[0]]]},
+                }
+            )
+    return features
+
+
+@pytest.mark.parametrize("tolerance", [0.005, 0.02, 0.08])
+def test_simplified_neighbours_share_borders(tolerance):
+    import shapely
+    from shapely.geometry import shape
+
+    features = _tiles(4)
+    simplified = simplify_features(features, tolerance)
+    assert [x["properties"] for x in simplified] == [x["properties"] for x in features]
+    shapes = [shape(x["geometry"]) for x in simplified]
+    assert all(x.is_valid for x in shapes)
+    assert sum(len(shapely.get_coordinates(x)) for x in shapes) < sum(
+        len(x["geometry"]["coordinates"][0]) for x in features
+    )
+    # Neither overlaps (the parts add up to their union) nor gaps (the union has no holes)
+    union = shapely.union_all(shapes)
+    assert sum(x.area for x in shapes) == pytest.approx(union.area, rel=1e-9)
+    assert union.geom_type == "Polygon" and len(union.interiors) == 0
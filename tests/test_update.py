@@ -0,0 +1,76 @@
+import copy
+import json
+
+import pytest
+from plotly.io.json import to_json_plotly
+
+import mapper
+from bench.fixtures import SCENARIOS, scenario_content
+
+DRAW_STAGES = {f"draw_{x}" for x in mapper.DRAW_GROUPS}
+
+
+@pytest.fixture
+def builder(small_root):
+    settings = copy.deepcopy(mapper.map_settings)
+    settings.update(
+        nat_label_toggle=True,
+        subnat_toggle=True,
+        subnat_label_toggle=True,
+        irregular_feature_toggle=True,
+        display_toggle=False,
+        output_path=None,
+    )
+    m = mapper.MapBuilder(
+        "tok", settings, scenario_content(SCENARIOS["small"]), copy.deepcopy(mapper.map_styling),
+        data=mapper.MapData(small_root),
+    )
+    m.draw_map()
+    return m
+
+
+def _fresh(m):
+    """The same map drawn from scratch"""
+    return mapper.MapBuilder(
+        "tok", copy.deepcopy(m.config), copy.deepcopy(m.content), copy.deepcopy(m.styling), data=m.data
+    ).draw_map()
+
+
+def _json(fig):
+    return json.loads(fig.to_json())
+
+
+@pytest.mark.parametrize(
+    "section, key, value, groups",
+    [
+        ("styling", "marker_color", "#ff0000", {"markers"}),
+        ("styling", "subnat_border_color", "#00ff00", {"subnats"}),
+        ("styling", "nat_border_width", 3, {"countries", "outlines", "irregulars"}),
+        ("styling", "feature_border_color", "#0000ff", {"irregulars"}),
+        ("settings", "nat_label_toggle", False, {"labels"}),
+        ("content", "label_adjusts", [], {"labels"}),
+    ],
+)
+def test_update_redraws_affected_groups(builder, section, key, value, groups):
+    unchanged = [to_json_plotly(x) for x in builder.fig.data if x.meta not in groups]
+    dictionaries = {
+        "settings": copy.deepcopy(builder.config),
+        "content": copy.deepcopy(builder.content),
+        "styling": copy.deepcopy(builder.styling),
+    }
+    dictionaries[section][key] = value
+    fig = builder.update(**dictionaries)
+
+    assert {x for x in builder.stage_times if x.startswith("draw_")} == {f"draw_{x}" for x in groups} & DRAW_STAGES
+    assert "load_geometry" not in builder.stage_times
+    # Traces of the other groups are kept as they were, and the result matches a full redraw
+    assert [to_json_plotly(x) for x in fig.data if x.meta not in groups] == unchanged
+    assert _json(fig) == _json(_fresh(builder))
+
+
+def test_update_rebuilds_on_unlisted_key(builder):
+    content = copy.deepcopy(builder.content)
+    content["country_list"] = content["country_list"][:1]
+    fig = builder.update(content=content)
+    assert "load_geometry" in builder.stage_times
+    assert _json(fig) == _json(_fresh(builder))
@@ -0,0 +1,113 @@
+"""Watch mode: re-renders a map every time its spec file is saved, redrawing only what the edit touched.
+
+    python watch.py map.json [-interval 0.5] [-nobrowser]
+
+The spec holds one map in the batch.py job schema (JSON, or YAML when PyYAML is installed);
+every section is optional and overrides the defaults of mapper.py:
+
+    {"output": "preview.html", "settings": {...}, "styling": {...},
+     "content": {"country_list": ["Canada"], "label_adjusts": [["Canada", "top", 2, 1]]}}
+
+The MapBuilder and its datasets stay in memory between saves. Each version of the spec is
+compared with the last one and only the affected trace groups are recomputed (moving a label
+redraws the labels, restyling cities redraws the markers; see mapper.REDRAW_GROUPS); other
+changes rebuild the map from the datasets already loaded. The output (default <spec name>.html,
+next to the spec) is rewritten after every save; reload the page to see the change.
+"""
+import os
+import sys
+import time
+import traceback
+import warnings
+import webbrowser
+from pathlib import Path
+
+import mapper
+from batch import build_jobs, load_manifest
+
+
+def load_spec(spec_path: Path):
+    """The map described by a spec file, merged onto the mapper.py defaults (see batch.build_jobs)"""
+    spec = load_manifest(spec_path)
+    spec.setdefault("name", spec_path.stem)
+    job = build_jobs({"jobs": [spec]}, spec_path.parent)[0]
+    job["settings"]["display_toggle"] = False
+    return job
+
+
+def _stamp(path: Path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watch(token: str, spec_path: Path, interval: float = 0.5, browser: bool = True, root: Path = None):
+    """Renders the spec, then polls it and patches the map on every change until interrupted"""
+    data = mapper.MapData(root) if root is not None else mapper.MapData()
+    m = None
+    stamp = None
+    opened = not browser
+
+    print(f"Watching {spec_path} (Ctrl+C to stop)")
+    while True:
+        try:
+            current = _stamp(spec_path)
+        except OSError:
+            # Some editors save by replacing the file; try again on the next poll
+            current = stamp
+        if current != stamp:
+            stamp = current
+            t = time.perf_counter()
+            try:
+                job = load_spec(spec_path)
+            except Exception:
+                # Half-written or invalid spec; the map is kept as it was
+                traceback.print_exc()
+                time.sleep(interval)
+                continue
+            try:
+                output = Path(job["settings"]["output_path"])
+                output.parent.mkdir(parents=True, exist_ok=True)
+                if m is None:
+                    m = mapper.MapBuilder(
+                        token, job["settings"], job["content"], job["styling"], data=data
+                    )
+                    m.draw_map()
+                else:
+                    m.update(job["settings"], job["content"], job["styling"])
+            except Exception:
+                traceback.print_exc()
+                # Start over from the next valid save
+                m = None
+            else:
+                print(
+                    f"{time.strftime('%H:%M:%S')} {output.name} in {time.perf_counter() - t:.3f}s ({', '.join(m.stage_times) or 'unchanged'})"
+                )
+                if not opened:
+                    webbrowser.open(output.resolve().as_uri())
+                    opened = True
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    map_token = os.getenv("MAP_TOKEN")
+
+    if not map_token:
+        print(
+            "Missing env values for MAP_TOKEN; Mapbox token required to create base map"
+        )
+        sys.exit(1)
+
+    if len(sys.argv) < 2:
+        print("Usage: python watch.py map.json [-interval seconds] [-nobrowser]")
+        sys.exit(1)
+
+    interval = 0.5
+    if "-interval" in sys.argv:
+        interval_index = sys.argv.index("-interval")
+        interval = float(sys.argv[interval_index + 1])
+
+    warnings.filterwarnings("ignore")
+    try:
+        watch(map_token, Path(sys.argv[1]), interval, browser="-nobrowser" not in sys.argv)
+    except KeyboardInterrupt:
+        pass